@@ -0,0 +1 @@
+"""Core engine modules for TotalControl G-code generation and optimization."""
@@ -0,0 +1,60 @@
+"""Compiled kernels for the travel optimizer.
+
+Separated from :mod:`core.travel_optimizer` so the kernels follow the
+same optional-numba shim and import-time warmup pattern as the other
+core modules; without numba they still run as plain Python, and callers
+choose the vectorized NumPy path instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # numba is an optional speed dependency
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in so the jitted kernels stay importable without numba."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def nn_order(starts, ends, cur_x, cur_y):
+    """Greedy nearest-neighbour permutation over (N, 2) start/end arrays.
+
+    Returns the int32 visiting order.  The scalar double loop compiles to
+    branch-light machine code with the distance math auto-vectorized, so
+    it beats the NumPy masked-argmin sweeps despite the same O(N^2)
+    shape.
+    """
+    n = starts.shape[0]
+    order = np.empty(n, dtype=np.int32)
+    visited = np.zeros(n, dtype=np.bool_)
+    cx = cur_x
+    cy = cur_y
+    for k in range(n):
+        best = -1
+        best_d2 = np.inf
+        for j in range(n):
+            if not visited[j]:
+                dx = starts[j, 0] - cx
+                dy = starts[j, 1] - cy
+                d2 = dx * dx + dy * dy
+                if d2 < best_d2:
+                    best_d2 = d2
+                    best = j
+        order[k] = best
+        visited[best] = True
+        cx = ends[best, 0]
+        cy = ends[best, 1]
+    return order
+
+
+if _HAVE_NUMBA:
+    # Pre-warm so the first layer doesn't pay compilation latency;
+    # cache=True keeps the compiled kernel across processes.
+    nn_order(np.zeros((1, 2)), np.zeros((1, 2)), 0.0, 0.0)
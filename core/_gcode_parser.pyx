@@ -0,0 +1,80 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""C tokenizer for single G-code lines.
+
+Compiled counterpart of ``parse_gcode_line``/``reconstruct_gcode_line`` in
+:mod:`core.ai_optimizer`.  Callers import this module through a try/except
+fallback there, so both signatures and return shapes must stay identical to
+the pure-Python versions.
+"""
+
+from libc.stdio cimport snprintf
+from libc.stdlib cimport strtod
+
+
+cpdef parse_gcode_line(str line):
+    """Parse a single G-code line into a dict of command and parameters.
+
+    Returns None for blank/comment-only lines.
+    """
+    cdef bytes data = line.encode("ascii", "replace")
+    cdef const char* buf = data
+    cdef Py_ssize_t n = len(data)
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t num_start
+    cdef char c
+    cdef char* endptr
+    cdef dict result = None
+
+    while i < n:
+        c = buf[i]
+        if c == b';':
+            break
+        if b'a' <= c <= b'z':
+            c -= 32  # fold to uppercase
+        if not (b'A' <= c <= b'Z'):
+            i += 1
+            continue
+        i += 1
+        num_start = i
+        while i < n and (
+            b'0' <= buf[i] <= b'9'
+            or buf[i] == b'+'
+            or buf[i] == b'-'
+            or buf[i] == b'.'
+        ):
+            i += 1
+        if result is None:
+            # First word is the command; keep its digits verbatim (G01).
+            result = {"cmd": chr(c) + data[num_start:i].decode("ascii")}
+        elif i > num_start:
+            result[chr(c)] = strtod(buf + num_start, &endptr)
+    return result
+
+
+# Canonical word order, mirrored from core.ai_optimizer.
+_PARAM_ORDER = ("X", "Y", "Z", "I", "J", "F", "E", "S", "P")
+
+
+cpdef str reconstruct_gcode_line(dict cmd_dict):
+    """Rebuild a G-code line from a parsed command dict.
+
+    The input dict is not mutated.
+    """
+    cdef char buffer[32]
+    cdef int written
+    cdef double value
+    cdef list parts = [cmd_dict["cmd"]]
+
+    for key in _PARAM_ORDER:
+        obj = cmd_dict.get(key)
+        if obj is None:
+            continue
+        value = obj
+        if key == "F":
+            written = snprintf(buffer, sizeof(buffer), b"%c%ld",
+                               <char>ord(key), <long>value)
+        else:
+            written = snprintf(buffer, sizeof(buffer), b"%c%.4f",
+                               <char>ord(key), value)
+        parts.append(buffer[:written].decode("ascii"))
+    return " ".join(parts)
@@ -0,0 +1,543 @@
+"""AI-driven G-code optimization.
+
+Rewrites generated programs based on material behavior and printer
+capabilities.  The current pass adjusts feedrates on extrusion moves; path
+and travel reordering live in their own passes.
+"""
+
+import functools
+import logging
+import math
+import re
+import sys
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # numba is an optional speed dependency
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in so the jitted kernels stay importable without numba."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+from materials.materials import get_material_properties
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FEEDRATE = 3000
+
+# Viscosity -> feedrate-increase factor as a piecewise-linear curve: thin
+# materials take the full 1.3x, viscous ones back off to 1.1x, with a
+# smooth ramp between instead of the old three-step bins.  np.interp
+# clamps to the end factors outside the breakpoints and extends to richer
+# material tables without growing branches.
+_VISCOSITY_BREAKPOINTS = np.array([0.9, 1.1])
+_FEED_FACTORS = np.array([1.3, 1.1])
+
+_F_RE = re.compile(r"\bF(\d+(?:\.\d+)?)")
+# Combined batch pattern: either a G/M command word or a parameter word.
+# One finditer over the whole joined program keeps token scanning inside the
+# C regex engine instead of a Python loop per line.
+_BATCH_TOKEN_RE = re.compile(r"([GM]\d+)|([XYZSEFPN])([-+]?\d*\.?\d+)")
+
+# Character classes for the line tokenizer.  The numeric classes (digit,
+# sign, dot) are contiguous so "part of a number" is a single range check.
+_CC_OTHER = 0
+_CC_LETTER = 1
+_CC_DIGIT = 2
+_CC_SIGN = 3
+_CC_DOT = 4
+_CC_SEMI = 5
+
+_CHAR_CLASS = bytearray(256)
+for _c in range(ord("A"), ord("Z") + 1):
+    _CHAR_CLASS[_c] = _CC_LETTER
+    _CHAR_CLASS[_c + 32] = _CC_LETTER  # lowercase
+for _c in b"0123456789":
+    _CHAR_CLASS[_c] = _CC_DIGIT
+_CHAR_CLASS[ord("+")] = _CHAR_CLASS[ord("-")] = _CC_SIGN
+_CHAR_CLASS[ord(".")] = _CC_DOT
+_CHAR_CLASS[ord(";")] = _CC_SEMI
+del _c
+
+
+def _tokenize_line(line):
+    """Split one G-code line into (letter, number-text) word pairs.
+
+    A single forward pass over the raw bytes with a small state machine —
+    no regex, no re-scanning.  Words do not need to be space separated
+    ("G01X25Y12" tokenizes the same as "G01 X25 Y12"), and everything from
+    the first semicolon on is ignored.
+    """
+    data = line.encode("ascii", "replace")
+    cls = _CHAR_CLASS
+    tokens = []
+    i = 0
+    n = len(data)
+    while i < n:
+        char_class = cls[data[i]]
+        if char_class == _CC_SEMI:
+            break
+        if char_class != _CC_LETTER:
+            i += 1
+            continue
+        letter = chr(data[i]).upper()
+        i += 1
+        num_start = i
+        while i < n and _CC_DIGIT <= cls[data[i]] <= _CC_DOT:
+            i += 1
+        tokens.append((letter, data[num_start:i].decode()))
+    return tokens
+
+
+def parse_gcode_line(line):
+    """Parse a single G-code line into a dict of command and parameters.
+
+    Returns None for blank/comment-only lines.
+    """
+    tokens = _tokenize_line(line)
+    if not tokens:
+        return None
+    letter, number = tokens[0]
+    result = {"cmd": letter + number}
+    for key, value in tokens[1:]:
+        if value:
+            result[key] = float(value)
+    return result
+
+
+# Canonical word order for rebuilt lines; iterating this fixed tuple avoids
+# both dict-view overhead and any dependence on insertion order.
+_PARAM_ORDER = ("X", "Y", "Z", "I", "J", "F", "E", "S", "P")
+
+# One pre-bound %-formatter per parameter key; binding __mod__ once at
+# import avoids re-parsing the format spec (and the F-vs-rest branch) on
+# every reconstructed word.  %d truncates, matching the old int() cast.
+_PARAM_FORMATTERS = {key: ("%s%%.4f" % key).__mod__ for key in _PARAM_ORDER}
+_PARAM_FORMATTERS["F"] = "F%d".__mod__
+
+
+def reconstruct_gcode_line(cmd_dict):
+    """Rebuild a G-code line from a parsed command dict.
+
+    The input dict is not mutated.
+    """
+    parts = [cmd_dict["cmd"]]
+    for key in _PARAM_ORDER:
+        value = cmd_dict.get(key)
+        if value is not None:
+            parts.append(_PARAM_FORMATTERS[key](value))
+    return " ".join(parts)
+
+
+try:
+    # Compiled versions of the two per-line hot functions; same signatures
+    # and return shapes as the pure-Python definitions above, which remain
+    # the fallback when the extension was not built.
+    from core._gcode_parser import (  # noqa: F811
+        parse_gcode_line,
+        reconstruct_gcode_line,
+    )
+except ImportError:
+    pass
+
+
+# G-code is highly repetitive — dense infill reuses the same few thousand
+# distinct lines — so parses are memoized keyed on the raw line.  The cache
+# holds immutable items-tuples; the public wrapper rebuilds a fresh dict per
+# call because callers mutate the result.
+_parse_gcode_line_uncached = parse_gcode_line
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _parse_gcode_line_items(line):
+    parsed = _parse_gcode_line_uncached(line)
+    return None if parsed is None else tuple(parsed.items())
+
+
+def parse_gcode_line(line):  # noqa: F811
+    """Parse a single G-code line into a dict of command and parameters.
+
+    Returns None for blank/comment-only lines.  Results are served from a
+    per-line memo cache; every call still gets its own mutable dict.
+    """
+    items = _parse_gcode_line_items(line)
+    return None if items is None else dict(items)
+
+
+# int8 command codes for the columnar representation; anything that is not
+# a linear move maps to -1.
+_CMD_CODES = {"G0": 0, "G1": 1}
+
+# Integer action codes for the parser's state updates: one dict lookup per
+# command, then integer compares instead of repeated string equality.
+_ACTION_NONE, _ACTION_MODE_ABS, _ACTION_MODE_REL, _ACTION_SET, _ACTION_MOVE = range(5)
+_CMD_ACTIONS = {
+    "G90": _ACTION_MODE_ABS,
+    "G91": _ACTION_MODE_REL,
+    "G92": _ACTION_SET,
+    "G0": _ACTION_MOVE,
+    "G1": _ACTION_MOVE,
+    "G2": _ACTION_MOVE,
+    "G3": _ACTION_MOVE,
+}
+
+
+def parse_gcode(gcode_lines, return_arrays=False):
+    """Parse a whole program into per-line command dicts with position state.
+
+    The comment-stripped input is joined into one buffer and scanned with a
+    single combined regex; each token's line is recovered by binary-searching
+    the precomputed line-end offsets.  G90/G91/G92 are honored while
+    tracking the absolute X/Y/Z/E position reached after each command.
+
+    Returns a list of dicts shaped ``{"cmd", "params", "current_pos"}``
+    (``current_pos`` is a length-4 ``[X, Y, Z, E]`` array snapshot), one
+    per non-empty command line, in program order.  With
+    ``return_arrays=True`` the result is ``(commands, arrays)`` where
+    ``arrays`` holds parallel columnar X/Y/Z/E position arrays plus an int8
+    command-code column (G0=0, G1=1, other=-1) — the structure-of-arrays
+    form the vectorized analysis passes consume.
+    """
+    stripped = [line.partition(";")[0] for line in gcode_lines]
+    buffer = "\n".join(stripped)
+    # line_ends[i] is the buffer offset one past the end of line i.
+    line_ends = np.cumsum(np.fromiter(
+        (len(line) + 1 for line in stripped), dtype=np.int64, count=len(stripped)
+    ))
+
+    starts = []
+    tokens = []
+    for match in _BATCH_TOKEN_RE.finditer(buffer):
+        starts.append(match.start())
+        cmd_word = match.group(1)
+        if cmd_word is not None:
+            # Interning collapses the millions of identical "G1" strings the
+            # regex allocates to one object, so later == checks short-circuit
+            # on identity.
+            tokens.append(("cmd", sys.intern(cmd_word)))
+        else:
+            tokens.append((match.group(2), float(match.group(3))))
+    if not starts:
+        if return_arrays:
+            return [], _empty_arrays()
+        return []
+    token_lines = np.searchsorted(line_ends, np.asarray(starts), side="right")
+
+    parsed_commands = []
+    # Position state lives in a 4-vector [X, Y, Z, E]; the per-axis update
+    # below is a single branchless np.where instead of eight dict branches.
+    current_pos = np.zeros(4)
+    absolute_mode = True
+    # All position snapshots live in one preallocated block (at most one
+    # command per input line); each command's "current_pos" is a row view
+    # into it, so no per-command copy is ever allocated.
+    positions = np.empty((len(stripped), 4))
+    col_code = []
+
+    def finalize(cmd, params):
+        nonlocal absolute_mode, current_pos
+        if cmd is None:
+            return
+        action = _CMD_ACTIONS.get(cmd, _ACTION_NONE)
+        if action >= _ACTION_SET:
+            get = params.get
+            delta = np.array([
+                get("X", np.nan),
+                get("Y", np.nan),
+                get("Z", np.nan),
+                get("E", np.nan),
+            ])
+            # Absolute (and G92, which always sets) replaces; relative adds.
+            scale = 0.0 if (absolute_mode or action == _ACTION_SET) else 1.0
+            current_pos = np.where(
+                np.isnan(delta), current_pos, delta + scale * current_pos
+            )
+        elif action == _ACTION_MODE_ABS:
+            absolute_mode = True
+        elif action == _ACTION_MODE_REL:
+            absolute_mode = False
+        row = len(parsed_commands)
+        positions[row] = current_pos
+        parsed_commands.append(
+            {"cmd": cmd, "params": params, "current_pos": positions[row]}
+        )
+        if return_arrays:
+            col_code.append(_CMD_CODES.get(cmd, -1))
+
+    line_of_cmd = -1
+    cmd = None
+    params = {}
+    for token_line, (key, value) in zip(token_lines.tolist(), tokens):
+        if token_line != line_of_cmd:
+            finalize(cmd, params)
+            line_of_cmd = token_line
+            cmd = None
+            params = {}
+        if key == "cmd":
+            cmd = value
+        else:
+            params[key] = value
+    finalize(cmd, params)
+    if return_arrays:
+        # Column views into the shared snapshot block — nothing is copied.
+        used = positions[: len(parsed_commands)]
+        arrays = {
+            "x": used[:, 0],
+            "y": used[:, 1],
+            "z": used[:, 2],
+            "e": used[:, 3],
+            "code": np.asarray(col_code, dtype=np.int8),
+        }
+        return parsed_commands, arrays
+    return parsed_commands
+
+
+def _empty_arrays():
+    zero = np.empty(0)
+    return {
+        "x": zero,
+        "y": zero,
+        "z": zero,
+        "e": zero,
+        "code": np.empty(0, dtype=np.int8),
+    }
+
+
+# Quantization scale for the integer-grid representation: 1 unit = 1 µm.
+MU = 1000
+
+
+def quantize_positions(arrays, mu=MU):
+    """Quantize columnar X/Y/Z positions onto an int32 µ-scaled grid.
+
+    ``floor(x * mu)`` discretization halves the memory traffic of the
+    coordinate columns and lets distance checks run in exact integer math.
+    The command-code column is passed through unchanged.
+    """
+    return {
+        "x": np.floor(arrays["x"] * mu).astype(np.int32),
+        "y": np.floor(arrays["y"] * mu).astype(np.int32),
+        "z": np.floor(arrays["z"] * mu).astype(np.int32),
+        "code": arrays["code"],
+    }
+
+
+def calculate_distance_quantized(x1, y1, z1, x2, y2, z2, mu=MU):
+    """Distance in model units between two points on the µ-scaled grid.
+
+    The squared sum is exact int64 arithmetic; only the final isqrt result
+    is scaled back to float, so there are no intermediate rounding edges.
+    """
+    dx = int(x2) - int(x1)
+    dy = int(y2) - int(y1)
+    dz = int(z2) - int(z1)
+    return math.isqrt(dx * dx + dy * dy + dz * dz) / mu
+
+
+def _move_arrays(parsed_commands):
+    """Build the columnar position arrays from already-parsed command dicts."""
+    n = len(parsed_commands)
+    x = np.empty(n)
+    y = np.empty(n)
+    z = np.empty(n)
+    e = np.empty(n)
+    code = np.empty(n, dtype=np.int8)
+    for i, command in enumerate(parsed_commands):
+        pos = command["current_pos"]
+        x[i] = pos[0]
+        y[i] = pos[1]
+        z[i] = pos[2]
+        e[i] = pos[3]
+        code[i] = _CMD_CODES.get(command["cmd"], -1)
+    return {"x": x, "y": y, "z": z, "e": e, "code": code}
+
+
+@njit(cache=True, fastmath=True)
+def calculate_distance(x1, y1, z1, x2, y2, z2):
+    """Euclidean distance between two points given as six scalars.
+
+    Scalar arguments (rather than tuples) keep the values unboxed inside
+    the jitted kernel.
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    dz = z2 - z1
+    return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+@njit(cache=True, fastmath=True)
+def calculate_angle_between_segments(x1, y1, x2, y2, x3, y3):
+    """Angle in degrees at (x2, y2) between the two XY path segments.
+
+    180 means the path continues straight on; values below that indicate a
+    corner.  Degenerate (zero-length) segments report 180 so they never
+    register as corners.
+    """
+    v1x = x2 - x1
+    v1y = y2 - y1
+    v2x = x3 - x2
+    v2y = y3 - y2
+    # atan2(|cross|, dot) is the turn angle directly — no sqrt, divide or
+    # acos-domain clamp needed, and atan2(0, 0) = 0 makes degenerate
+    # segments read as straight-on for free.
+    cross = v1x * v2y - v1y * v2x
+    dot = v1x * v2x + v1y * v2y
+    return 180.0 - math.degrees(math.atan2(abs(cross), dot))
+
+
+if _HAVE_NUMBA:
+    # Pre-warm so the first real program doesn't pay compilation latency.
+    calculate_distance(0.0, 0.0, 0.0, 1.0, 1.0, 1.0)
+    calculate_angle_between_segments(0.0, 0.0, 1.0, 0.0, 1.0, 1.0)
+
+# Corners sharper than this (degrees) get flagged for speed adjustment.
+CORNER_ANGLE_THRESHOLD = 150.0
+
+
+def analyze_geometric_features(parsed_commands, arrays=None):
+    """Detect corners along the toolpath of a parsed program.
+
+    Measures the angle at every intermediate XY point of the move sequence
+    as one vectorized pass over the columnar position arrays (built here if
+    the caller did not request them from :func:`parse_gcode`).  Returns a
+    list of feature dicts ``{"index", "angle", "position"}`` for every
+    corner sharper than ``CORNER_ANGLE_THRESHOLD``.
+    """
+    if arrays is None:
+        arrays = _move_arrays(parsed_commands)
+    move_mask = arrays["code"] >= 0
+    move_indices = np.flatnonzero(move_mask)
+    if len(move_indices) < 3:
+        return []
+    x = arrays["x"][move_mask]
+    y = arrays["y"][move_mask]
+
+    dx = np.diff(x)
+    dy = np.diff(y)
+    # Same atan2 identity as the scalar kernel: no magnitudes, no divide,
+    # no clip, and degenerate segments read as straight-on for free.
+    dots = dx[:-1] * dx[1:] + dy[:-1] * dy[1:]
+    crosses = dx[:-1] * dy[1:] - dy[:-1] * dx[1:]
+    angles = 180.0 - np.degrees(np.arctan2(np.abs(crosses), dots))
+
+    features = []
+    for k in np.flatnonzero(angles < CORNER_ANGLE_THRESHOLD).tolist():
+        features.append(
+            {
+                "index": int(move_indices[k + 2]),
+                "angle": float(angles[k]),
+                "position": (float(x[k + 1]), float(y[k + 1])),
+            }
+        )
+    return features
+
+
+def parse_and_analyze(gcode_lines, analyze=True):
+    """Parse a program and detect its corners in one combined pass.
+
+    The raw bytes are tokenized exactly once; geometry analysis then runs
+    over the compact position block the parser just filled — still warm in
+    cache — rather than re-walking per-command dicts.  Returns
+    ``(parsed_commands, features)``; with ``analyze=False`` the geometry
+    work is skipped and ``features`` is an empty list.
+    """
+    parsed_commands, arrays = parse_gcode(gcode_lines, return_arrays=True)
+    if not analyze:
+        return parsed_commands, []
+    return parsed_commands, analyze_geometric_features(parsed_commands, arrays)
+
+
+def optimize_gcode(gcode_commands, material_name="PLA", printer_capabilities=None):
+    """Adjust feedrates on extrusion moves for the given material.
+
+    Less viscous materials tolerate more aggressive speed increases; the
+    result is always clamped to the printer's max feedrate.
+    """
+    if printer_capabilities is None:
+        printer_capabilities = {}
+    material_properties = get_material_properties(material_name)
+    viscosity_index = material_properties.get("viscosity_index", 1.0)
+    feedrate_increase_factor = float(
+        np.interp(viscosity_index, _VISCOSITY_BREAKPOINTS, _FEED_FACTORS)
+    )
+
+    max_feedrate = printer_capabilities.get("max_feedrate", DEFAULT_MAX_FEEDRATE)
+
+    # Gather all G1 feedrates in one scan, scale and clamp them as a single
+    # array operation, then splice the results back; non-G1 lines (and G1
+    # lines without an F word) pass through untouched at their original
+    # indices.
+    g1_indices = []
+    feedrates = []
+    # Hoist attribute lookups out of the scan loop; max_feedrate above is
+    # likewise read from printer_capabilities exactly once per call.
+    search = _F_RE.search
+    add_index = g1_indices.append
+    add_feedrate = feedrates.append
+    for i, line in enumerate(gcode_commands):
+        # Early-reject on the raw prefix; the digit check keeps G10..G19
+        # codes from slipping into the G1 fast path.
+        if line.startswith("G1") and (len(line) == 2 or not line[2].isdigit()):
+            match = search(line)
+            if match:
+                add_index(i)
+                add_feedrate(float(match.group(1)))
+
+    optimized_gcode = list(gcode_commands)
+    if g1_indices:
+        # Partial evaluation of min(f * factor, max): the loop-invariant
+        # ceiling max/factor is computed once, so the per-line work is a
+        # branchless select against it.  Lines at or above the ceiling get
+        # the exact max feedrate rather than a rounded-through product.
+        feed_ceiling = max_feedrate / feedrate_increase_factor
+        original = np.asarray(feedrates)
+        new_feedrates = np.where(
+            original < feed_ceiling,
+            original * feedrate_increase_factor,
+            float(max_feedrate),
+        ).astype(np.int64)
+        for i, feedrate in zip(g1_indices, new_feedrates.tolist()):
+            optimized_gcode[i] = _F_RE.sub(
+                "F%d" % feedrate, optimized_gcode[i], count=1
+            )
+    return optimized_gcode
+
+
+def iter_optimize_gcode(gcode_stream, material_name="PLA", printer_capabilities=None):
+    """Streaming counterpart of :func:`optimize_gcode`.
+
+    Accepts any iterable of lines (including a file object) and yields
+    optimized lines one at a time, keeping the resident set O(1) for
+    multi-gigabyte toolpaths.  The batch version stays the faster choice
+    when the program is already in memory.
+    """
+    if printer_capabilities is None:
+        printer_capabilities = {}
+    material_properties = get_material_properties(material_name)
+    viscosity_index = material_properties.get("viscosity_index", 1.0)
+    factor = float(
+        np.interp(viscosity_index, _VISCOSITY_BREAKPOINTS, _FEED_FACTORS)
+    )
+    max_feedrate = printer_capabilities.get("max_feedrate", DEFAULT_MAX_FEEDRATE)
+    feed_ceiling = max_feedrate / factor
+
+    search = _F_RE.search
+    for line in gcode_stream:
+        if line.startswith("G1") and (len(line) == 2 or not line[2].isdigit()):
+            match = search(line)
+            if match:
+                feedrate = float(match.group(1))
+                if feedrate >= feed_ceiling:
+                    feedrate = max_feedrate
+                else:
+                    feedrate *= factor
+                line = _F_RE.sub("F%d" % int(feedrate), line, count=1)
+        yield line
@@ -0,0 +1,133 @@
+"""Columnar (SoA) in-memory representation of a G-code program.
+
+``GcodeBuffer`` stores move lines as parallel NumPy columns — an int8
+command code plus one float column per axis, NaN marking an absent word —
+instead of a ``list[str]``.  Passes over the program then run on arrays
+(or the compiled kernels in :mod:`core.gcode_jit`) rather than re-parsing
+strings, and the text form is produced exactly once at the boundary.
+Non-move lines (comments, M-codes, headers) pass through verbatim via a
+side list the code columns index into.
+"""
+
+import re
+
+import numpy as np
+
+from core.gcode_jit import CODE_G0, CODE_G1, CODE_OTHER, filter_moves_mask
+from core.segment_primitives import format_coord
+
+# Matches the axis words our emitters produce; mirrored from the
+# gcode_generator transform path.
+_AXIS_RE = re.compile(r"([XYZ])(-?\d+(?:\.\d+)?)")
+_CMD_CODES = {"G0": CODE_G0, "G1": CODE_G1}
+_CMD_NAMES = {CODE_G0: "G0", CODE_G1: "G1"}
+
+
+class GcodeBuffer:
+    """Growable structure-of-arrays program buffer.
+
+    Columns grow by doubling, so appends are amortized O(1); payload for
+    non-move lines lives in ``_other`` with the row storing its index.
+    """
+
+    def __init__(self, capacity=1024):
+        self._codes = np.full(capacity, CODE_OTHER, dtype=np.int8)
+        self._x = np.full(capacity, np.nan)
+        self._y = np.full(capacity, np.nan)
+        self._z = np.full(capacity, np.nan)
+        self._other_idx = np.full(capacity, -1, dtype=np.int32)
+        self._other = []
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self):
+        capacity = 2 * self._codes.shape[0]
+        for name in ("_codes", "_x", "_y", "_z", "_other_idx"):
+            old = getattr(self, name)
+            new = np.full(capacity, np.nan if old.dtype.kind == "f" else -1,
+                          dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, name, new)
+
+    def append_move(self, code, x=np.nan, y=np.nan, z=np.nan):
+        """Append a G0/G1 move row; NaN omits that axis word."""
+        if self._n == self._codes.shape[0]:
+            self._grow()
+        i = self._n
+        self._codes[i] = code
+        self._x[i] = x
+        self._y[i] = y
+        self._z[i] = z
+        self._n = i + 1
+
+    def append_line(self, line):
+        """Append any line, parsing pure-axis G0/G1 moves into columns.
+
+        Only moves whose every word is an X/Y/Z axis word go into the
+        columns; a move carrying anything else (E, F, S, a comment) is
+        kept verbatim in the side list, since the columns cannot round-
+        trip those words.
+        """
+        parts = line.split()
+        if (
+            len(parts) > 1
+            and parts[0] in _CMD_CODES
+            and all(_AXIS_RE.fullmatch(part) for part in parts[1:])
+        ):
+            coords = {part[0]: float(part[1:]) for part in parts[1:]}
+            self.append_move(
+                _CMD_CODES[parts[0]],
+                coords.get("X", np.nan),
+                coords.get("Y", np.nan),
+                coords.get("Z", np.nan),
+            )
+            return
+        if self._n == self._codes.shape[0]:
+            self._grow()
+        i = self._n
+        self._codes[i] = CODE_OTHER
+        self._other_idx[i] = len(self._other)
+        self._other.append(line)
+        self._n = i + 1
+
+    def extend_lines(self, lines):
+        for line in lines:
+            self.append_line(line)
+
+    def filter_redundant(self):
+        """Drop moves that do not change position, compacting in place."""
+        n = self._n
+        keep = filter_moves_mask(
+            self._codes[:n], self._x[:n], self._y[:n], self._z[:n]
+        )
+        kept = int(np.count_nonzero(keep))
+        if kept == n:
+            return
+        for name in ("_codes", "_x", "_y", "_z", "_other_idx"):
+            column = getattr(self, name)
+            column[:kept] = column[:n][keep]
+        self._n = kept
+
+    def to_lines(self):
+        """Serialize back to a list of command strings."""
+        lines = []
+        append = lines.append
+        other = self._other
+        for i in range(self._n):
+            code = self._codes[i]
+            if code == CODE_OTHER:
+                append(other[self._other_idx[i]])
+                continue
+            parts = [_CMD_NAMES[code]]
+            for word, value in (("X", self._x[i]), ("Y", self._y[i]),
+                                ("Z", self._z[i])):
+                if value == value:  # not NaN
+                    parts.append(word + format_coord(value))
+            append(" ".join(parts))
+        return lines
+
+    def __str__(self):
+        """Program text; the single join at the boundary."""
+        return "\n".join(self.to_lines()) + "\n"
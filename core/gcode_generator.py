@@ -0,0 +1,1259 @@
+"""Core engine for turning JSON path descriptions into G-code.
+
+This module sequences the primitive emitters from ``core.segment_primitives``
+into full programs: it handles travel pre-moves, nested repeat/style/structure
+segments, transforms, global modifiers/constraints and redundant-move cleanup.
+"""
+
+import functools
+import json
+import logging
+import math
+import os
+import re
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # numba is an optional speed dependency
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in so the jitted kernels stay importable without numba."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+from core.segment_primitives import (
+    DEFAULT_EXTRUSION_RATE,
+    DEFAULT_FEEDRATE,
+    format_coord,
+    generate_gcode_arc,
+    generate_gcode_bezier,
+    generate_gcode_line,
+    generate_gcode_spiral,
+)
+from core.utils import parse_json_input
+
+try:
+    # google-re2 compiles to a DFA: linear-time scans with no backtracking,
+    # worthwhile on whole-program buffers.  Optional, like the other speed
+    # extras; the stdlib engine is API-compatible for the patterns used here.
+    import re2 as _scan_re
+except ImportError:
+    _scan_re = re
+
+logger = logging.getLogger(__name__)
+
+# Movement commands our emitters produce; used for cheap prefix checks.
+_MOVE_PREFIXES = ("G0", "G1", "G2", "G3")
+# Tolerance for "already at this position" checks on travel pre-moves.
+_POS_EPS = 1e-9
+# Shared read-only defaults: inline [0,0,0] dict.get defaults allocate a
+# throwaway list per access on the hot segment loop.
+_ORIGIN = (0.0, 0.0, 0.0)
+_DEFAULT_SIZE = (10.0, 10.0, 10.0)
+# Travel pre-move template; %-formatting beats the f-string
+# PyObject_Format path on the hot emission lines.  Coordinates go through
+# format_coord so zero-aligned moves shed their trailing-zero bloat.
+_G0_XYZ_FMT = "G0 X%s Y%s Z%s"
+_G0_XY_FMT = "G0 X%s Y%s"
+# One compiled scan extracts all axis words from a line; the C regex engine
+# beats a Python-level split + startswith loop per token.
+_AXIS_RE = re.compile(r"([XYZ])(-?\d+(?:\.\d+)?)")
+# Fixed header/footer boilerplate, interned so downstream string equality
+# checks on these lines short-circuit on identity.
+_G21 = sys.intern("G21 ; Set units to millimeters")
+_G90 = sys.intern("G90 ; Absolute positioning")
+_M2 = sys.intern("M2 ; End of program")
+
+
+def generate_gcode_segment(segment, transform_matrix=None):
+    """Generate G-code for a single segment of any supported type.
+
+    Dispatch is one dict lookup on the segment type instead of a chain of
+    string comparisons.  ``transform_matrix`` carries the composed affine
+    of any enclosing wrappers; it is folded with this segment's own
+    transform by matrix multiply and applied once at the innermost level,
+    so nested style chains do one coordinate splice instead of one per
+    nesting depth.
+    """
+    segment_type = segment.get("type")
+    generator = _SEGMENT_DISPATCH.get(segment_type)
+    if generator is None:
+        raise ValueError(f"Unsupported segment type: {segment_type}")
+
+    transform = segment.get("transform")
+    M = transform_matrix
+    # A repeat wrapper consumes its own transform per iteration inside
+    # generate_gcode_repeat; folding it into the matrix here as well
+    # would apply it twice.  Only enclosing wrappers' M touches its output.
+    if (
+        segment_type != "repeat"
+        and isinstance(transform, dict)
+        and _is_active_transform(transform)
+    ):
+        own = build_affine(transform)
+        M = own if M is None else M @ own
+
+    if segment_type == "style":
+        # Pure pass-through wrapper: push the composed matrix down to the
+        # inner segment rather than splicing this level's output.
+        return list(generate_gcode_style(segment, transform_matrix=M))
+
+    gcode_commands = generator(segment)
+    # Wrapper emitters yield lazily; materialize exactly once here, at the
+    # dispatch boundary, so nested style/repeat/structure levels never copy
+    # lines through intermediate lists.
+    if not isinstance(gcode_commands, list):
+        gcode_commands = list(gcode_commands)
+
+    if M is not None:
+        gcode_commands = _apply_matrix(gcode_commands, M)
+    return gcode_commands
+
+
+@functools.lru_cache(maxsize=512)
+def _generate_segment_cached(json_key):
+    """Memoized segment emission keyed by canonical JSON text.
+
+    Returns an immutable tuple so cached programs can be yielded or
+    spliced by any number of callers without copying.
+    """
+    return tuple(generate_gcode_segment(json.loads(json_key)))
+
+
+def _cached_segment_gcode(segment):
+    """Emit a segment through the memo cache when its spec is hashable.
+
+    Repeat-of-repeat and style-wrapping-repeat patterns re-emit the same
+    inner spec many times; canonical JSON text makes the dict a cache key.
+    Specs that do not round-trip through JSON fall back to direct emission.
+    """
+    try:
+        key = json.dumps(segment, sort_keys=True)
+    except (TypeError, ValueError):
+        return generate_gcode_segment(segment)
+    return _generate_segment_cached(key)
+
+
+# Below this many top-level segments the fork/pickle overhead of a process
+# pool outweighs the parallel emission win.
+_PARALLEL_MIN_SEGMENTS = 512
+
+
+def _safe_generate_segment(segment):
+    """Worker-side wrapper: generation errors travel back as None."""
+    try:
+        return generate_gcode_segment(segment)
+    except ValueError:
+        return None
+
+
+def _generate_segments_parallel(segments_data, max_workers=None):
+    """Emit all top-level segments on a process pool, preserving order.
+
+    Per-segment emission is independent; the serial remainder — travel
+    pre-moves and position tracking — runs afterwards in
+    :func:`_iter_segment_lines` over the pregenerated chunks.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        chunksize = max(1, len(segments_data) // (os.cpu_count() or 1))
+        return list(executor.map(
+            _safe_generate_segment, segments_data, chunksize=chunksize
+        ))
+
+
+def generate_gcode_style(segment, transform_matrix=None):
+    """Yield G-code for a styled wrapper segment (e.g. dashed lines).
+
+    Any composed wrapper transform is handed straight down to the inner
+    segment; the comment line this level adds has no coordinates to
+    rewrite.
+    """
+    style_type = segment.get("style_type", "solid")
+    inner_segment = segment.get("segment")
+    if not isinstance(inner_segment, dict):
+        logger.error("Style segment is missing an inner segment: %s", segment)
+        return
+
+    yield f"; style: {style_type}"
+    yield from generate_gcode_segment(inner_segment, transform_matrix=transform_matrix)
+
+
+def generate_gcode_repeat(segment):
+    """Yield G-code for a repeated segment, applying the per-iteration
+    transform each time."""
+    repeated_segment_data = segment.get("segment")
+    count = segment.get("count", 1)
+    transform = segment.get("transform", {})
+    if not isinstance(repeated_segment_data, dict):
+        logger.error("Repeat segment is missing an inner segment: %s", segment)
+        return
+
+    # The base segment is identical every iteration; only the transform
+    # varies with i, so generate it once and re-transform the cached copy.
+    # The memo layer also de-duplicates across sibling repeats of the same
+    # inner spec.
+    base_gcode = _cached_segment_gcode(repeated_segment_data)
+    if not _is_active_transform(transform):
+        # No operative keys: every iteration is the base segment verbatim,
+        # so skip the per-iteration transform call (and its list copy).
+        for _ in range(count):
+            yield from base_gcode
+        return
+
+    # Parse the cached base exactly once; iterations then reduce to one
+    # rotated-points add plus the string splice.  The rotation/scale part
+    # of the matrix never depends on i — only the translation walks.
+    move_indices, pts = _extract_move_points(base_gcode)
+    if not move_indices:
+        for _ in range(count):
+            yield from base_gcode
+        return
+    R, t0 = _transform_matrix(transform, _ORIGIN)
+    rotated = np.asarray(pts, dtype=np.float64) @ R.T
+    if transform.get("type") != "cumulative_offset":
+        # Iterations are independent of i, which here means they are
+        # *identical*: transform once and replay the rendered lines, so
+        # extra repeats cost nothing beyond the yields.
+        transformed = _rewrite_moves(base_gcode, move_indices, rotated + t0)
+        for _ in range(count):
+            yield from transformed
+        return
+    # All count walking translations in one broadcast; each iteration then
+    # reduces to an (M, 3) add plus the string splice.
+    step = np.asarray(
+        transform.get("offset_per_repeat", _ORIGIN), dtype=np.float64
+    )
+    offsets = t0 + np.arange(count)[:, None] * step
+    for t in offsets:
+        yield from _rewrite_moves(base_gcode, move_indices, rotated + t)
+
+
+def generate_gcode_structure(segment):
+    """Generate G-code for a structured infill segment (lattice/honeycomb).
+
+    Placeholder implementation until the procedural infill generators land.
+    """
+    structure_type = segment.get("structure_type", "lattice")
+    generator = _STRUCTURE_DISPATCH.get(structure_type)
+    if generator is None:
+        raise ValueError(f"Unsupported structure type: {structure_type}")
+    return generator(segment)
+
+
+def _structure_params(segment):
+    """Pull the shared origin/size/step/feed parameters for structures."""
+    origin = segment.get("origin", _ORIGIN)
+    size = segment.get("size", _DEFAULT_SIZE)
+    step = float(segment.get("step", 1.0))
+    feedrate = segment.get("feedrate", DEFAULT_FEEDRATE)
+    extrusion = segment.get("extrusion_rate", DEFAULT_EXTRUSION_RATE)
+    return origin, size, step, feedrate, extrusion
+
+
+def _generate_structure_lattice(segment):
+    """Yield a rectangular lattice: X- and Y-direction struts on a regular
+    grid, one layer per Z step.
+
+    Grid coordinates come from one meshgrid per strut direction so all the
+    geometry math is vectorized; only the emission loop is Python, and it
+    yields straight to the consumer without an intermediate list.
+    """
+    (ox, oy, oz), (w, h, d), step, feedrate, extrusion = _structure_params(segment)
+    xs = ox + np.arange(0.0, w + 0.5 * step, step)
+    ys = oy + np.arange(0.0, h + 0.5 * step, step)
+    zs = oz + np.arange(0.0, d + 0.5 * step, step)
+
+    yield "; structure: lattice"
+
+    # X-direction struts: one per (y, z) grid node.
+    yy, zz = np.meshgrid(ys, zs, indexing="ij")
+    x_end = ox + w
+    for y, z in zip(yy.ravel().tolist(), zz.ravel().tolist()):
+        yield "G0 X%.3f Y%.3f Z%.3f" % (ox, y, z)
+        yield "G1 X%.3f Y%.3f Z%.3f F%s E%s" % (x_end, y, z, feedrate, extrusion)
+
+    # Y-direction struts: one per (x, z) grid node.
+    xx, zz = np.meshgrid(xs, zs, indexing="ij")
+    y_end = oy + h
+    for x, z in zip(xx.ravel().tolist(), zz.ravel().tolist()):
+        yield "G0 X%.3f Y%.3f Z%.3f" % (x, oy, z)
+        yield "G1 X%.3f Y%.3f Z%.3f F%s E%s" % (x, y_end, z, feedrate, extrusion)
+
+
+def _generate_structure_honeycomb(segment):
+    """Yield a honeycomb-style infill: rows of points with every other row
+    offset by half a step, traced as one polyline per row per layer.
+
+    The point grid is built with meshgrid and the half-step row offset is one
+    strided array add, so millions of short segments never touch a Python
+    coordinate loop.
+    """
+    (ox, oy, oz), (w, h, d), step, feedrate, extrusion = _structure_params(segment)
+    xs = ox + np.arange(0.0, w + 0.5 * step, step)
+    ys = oy + np.arange(0.0, h + 0.5 * step, step)
+    zs = oz + np.arange(0.0, d + 0.5 * step, step)
+
+    xx, _ = np.meshgrid(xs, ys, indexing="ij")  # (n_x, n_y)
+    xx = xx.copy()
+    xx[:, 1::2] += step / 2.0  # offset alternating rows for the honeycomb stagger
+
+    yield "; structure: honeycomb"
+    for z in zs.tolist():
+        for j, y in enumerate(ys.tolist()):
+            row = xx[:, j].tolist()
+            yield "G0 X%.3f Y%.3f Z%.3f" % (row[0], y, z)
+            for x in row[1:]:
+                yield "G1 X%.3f Y%.3f Z%.3f F%s E%s" % (x, y, z, feedrate, extrusion)
+
+
+# Module-level dispatch tables: one dict lookup replaces an if/elif chain of
+# string compares per segment.
+_SEGMENT_DISPATCH = {
+    "line": generate_gcode_line,
+    "arc": generate_gcode_arc,
+    "bezier": generate_gcode_bezier,
+    "spiral": generate_gcode_spiral,
+    "style": generate_gcode_style,
+    "repeat": generate_gcode_repeat,
+    "structure": generate_gcode_structure,
+}
+_STRUCTURE_DISPATCH = {
+    "lattice": _generate_structure_lattice,
+    "honeycomb": _generate_structure_honeycomb,
+}
+
+
+_MOVE_WORD_RE = re.compile(r"([XYZFE])(-?\d+(?:\.\d+)?)")
+
+
+@dataclass(slots=True)
+class Move:
+    """Binary-friendly in-memory form of one movement command.
+
+    Multi-pass pipelines (transform, modifier, optimizer) should parse ASCII
+    lines into Moves once, mutate fields directly, and serialize exactly once
+    at the output boundary instead of re-tokenizing strings per pass.
+    """
+
+    cmd: str
+    x: float = None
+    y: float = None
+    z: float = None
+    f: float = None
+    e: float = None
+
+    @classmethod
+    def parse(cls, line):
+        """Parse a movement line, or return None for non-movement lines."""
+        if not line.startswith(_MOVE_PREFIXES):
+            return None
+        # Single C-level scan drops any inline comment before tokenizing.
+        line = line.partition(";")[0]
+        cmd = line.split(maxsplit=1)[0]
+        words = dict(_MOVE_WORD_RE.findall(line[len(cmd):]))
+        return cls(
+            cmd=cmd,
+            x=float(words["X"]) if "X" in words else None,
+            y=float(words["Y"]) if "Y" in words else None,
+            z=float(words["Z"]) if "Z" in words else None,
+            f=float(words["F"]) if "F" in words else None,
+            e=float(words["E"]) if "E" in words else None,
+        )
+
+    def __str__(self):
+        parts = [self.cmd]
+        if self.x is not None:
+            parts.append("X%.3f" % self.x)
+        if self.y is not None:
+            parts.append("Y%.3f" % self.y)
+        if self.z is not None:
+            parts.append("Z%.3f" % self.z)
+        if self.f is not None:
+            parts.append("F%d" % self.f)
+        if self.e is not None:
+            parts.append("E%g" % self.e)
+        return " ".join(parts)
+
+    def to_binary(self):
+        """Pack into a fixed 24-byte record (cmd number + five float words).
+
+        Absent words are stored as NaN.
+        """
+        nan = float("nan")
+        return struct.pack(
+            "<f5f",
+            float(self.cmd[1:]) if self.cmd[1:].isdigit() else -1.0,
+            self.x if self.x is not None else nan,
+            self.y if self.y is not None else nan,
+            self.z if self.z is not None else nan,
+            self.f if self.f is not None else nan,
+            self.e if self.e is not None else nan,
+        )
+
+
+def parse_moves(gcode_commands):
+    """Parse lines into (Move | str) items: movement lines become Moves,
+    everything else passes through as the original string."""
+    return [Move.parse(line) or line for line in gcode_commands]
+
+
+def emit_moves(items):
+    """Serialize a (Move | str) list back to command strings in one pass."""
+    return [str(item) for item in items]
+
+
+# Keys that actually move geometry; anything else makes the transform a no-op.
+_ACTIVE_TRANSFORM_KEYS = frozenset({"offset", "rotate", "scale"})
+
+
+def _is_active_transform(transform):
+    """True when a transform spec would actually move geometry."""
+    return bool(transform) and (
+        bool(_ACTIVE_TRANSFORM_KEYS.intersection(transform))
+        or transform.get("type") == "cumulative_offset"
+    )
+
+
+def _rotation_matrix(axis, angle_deg):
+    """Build the 3x3 rotation matrix for an axis letter and angle in degrees."""
+    angle = math.radians(angle_deg)
+    c = math.cos(angle)
+    s = math.sin(angle)
+    if axis == "z":
+        return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+    if axis == "y":
+        return np.array([[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]])
+    if axis == "x":
+        return np.array([[1.0, 0.0, 0.0], [0.0, c, -s], [0.0, s, c]])
+    logger.warning("Unknown rotation axis: %s", axis)
+    return np.eye(3)
+
+
+def _transform_matrix(transform, base_offset):
+    """Compose every operative key of a transform spec into one rotation/scale
+    matrix R and translation vector t, so points transform as ``p @ R.T + t``.
+
+    Scale applies first, then rotation, then offsets, so a spec combining
+    them behaves like the equivalent nested transforms.  ``rotate`` expects
+    an (axis, angle-in-degrees) pair, rotating about the origin.
+    """
+    R = np.eye(3)
+    t = np.zeros(3)
+    if "scale" in transform:
+        R = np.diag(np.asarray(transform["scale"], dtype=np.float64))
+    if "rotate" in transform:
+        axis, angle_deg = transform["rotate"]
+        rot = _rotation_matrix(axis, angle_deg)
+        R = rot @ R
+    if "offset" in transform:
+        t = t + np.asarray(transform["offset"], dtype=np.float64)
+    if transform.get("type") == "cumulative_offset":
+        t = t + np.asarray(base_offset, dtype=np.float64)
+    return R, t
+
+
+def build_affine(transform, base_offset=None):
+    """Compose a transform spec into one homogeneous 4x4 matrix.
+
+    Convenience entry for callers that want to combine or cache transforms
+    themselves; points transform as ``p @ M[:3, :3].T + M[:3, 3]``.
+    """
+    R, t = _transform_matrix(transform, base_offset or _ORIGIN)
+    M = np.eye(4)
+    M[:3, :3] = R
+    M[:3, 3] = t
+    return M
+
+
+def build_transform_stack(transform, count, base_offset=None):
+    """Compose a repeat's per-iteration matrices into one (count, 4, 4) stack.
+
+    The rotation/scale block never depends on the iteration; only the
+    translation column walks for ``cumulative_offset``, so the stack is a
+    broadcast of :func:`build_affine` with a vectorized translation fill.
+    Points transform in one shot as
+    ``np.einsum('tij,mj->tmi', stack[:, :3, :3], pts) + stack[:, None, :3, 3]``.
+    """
+    R, t = _transform_matrix(transform, base_offset or _ORIGIN)
+    stack = np.broadcast_to(np.eye(4), (count, 4, 4)).copy()
+    stack[:, :3, :3] = R
+    stack[:, :3, 3] = t
+    if transform.get("type") == "cumulative_offset":
+        step = np.asarray(
+            transform.get("offset_per_repeat", _ORIGIN), dtype=np.float64
+        )
+        stack[:, :3, 3] += np.arange(count)[:, None] * step
+    return stack
+
+
+def _extract_move_points(gcode_commands):
+    """Gather (indices, XYZ tuples) of every movement line with axis words.
+
+    Axis words are modal — the emitters omit a word whose value has not
+    changed — so each point seeds from the previous point's coordinates:
+    a missing word means "still there", not zero.  Axes never mentioned
+    before their first omission default to 0.0.
+    """
+    move_indices = []
+    pts = []
+    x = y = z = 0.0
+    for idx, command in enumerate(gcode_commands):
+        if not command.startswith(_MOVE_PREFIXES):
+            continue
+        coords = {axis: float(value) for axis, value in _AXIS_RE.findall(command)}
+        if not coords:
+            continue
+        x = coords.get("X", x)
+        y = coords.get("Y", y)
+        z = coords.get("Z", z)
+        move_indices.append(idx)
+        pts.append((x, y, z))
+    return move_indices, pts
+
+
+def _rewrite_moves(gcode_commands, move_indices, transformed):
+    """Copy the command list with transformed coordinates spliced back in.
+
+    Every rewritten move gets all three axis words: a word the emitter
+    suppressed modally (an unchanged Z, say) becomes load-bearing once
+    the transform mixes axes, and its old implied value is wrong anyway.
+    Words repeating the previous line are re-suppressed later by the
+    modal compression in finalization.  Non-axis words keep their
+    original order after the coordinates.
+    """
+    result = list(gcode_commands)
+    for row, idx in zip(transformed.tolist(), move_indices):
+        parts = result[idx].split()
+        tail = [part for part in parts[1:] if part[:1] not in "XYZ"]
+        result[idx] = " ".join((
+            parts[0],
+            "X%.3f" % row[0],
+            "Y%.3f" % row[1],
+            "Z%.3f" % row[2],
+            *tail,
+        ))
+    return result
+
+
+def apply_transformation(gcode_commands, transform, iteration=0,
+                         total_iterations=1, base_offset=None):
+    """Apply a geometric transform to a list of G-code commands.
+
+    Supports ``offset``, ``rotate`` (axis + angle in degrees, about the
+    origin), ``scale`` and ``cumulative_offset`` (per-repeat offsets driven
+    by ``iteration``/``base_offset``).  All movement coordinates are gathered
+    into one (N, 3) array and transformed with a single matrix multiply
+    rather than per-point trig.
+    """
+    # Identity fast path: the common repeat-without-transform case should not
+    # pay for a parse/format round trip.
+    if not _is_active_transform(transform):
+        return list(gcode_commands)
+
+    if base_offset is None:
+        base_offset = _ORIGIN
+    R, t = _transform_matrix(transform, base_offset)
+
+    move_indices, pts = _extract_move_points(gcode_commands)
+    if not move_indices:
+        return list(gcode_commands)
+
+    transformed = np.asarray(pts, dtype=np.float64) @ R.T + t
+    return _rewrite_moves(gcode_commands, move_indices, transformed)
+
+
+def _apply_matrix(gcode_commands, M):
+    """Splice a pre-composed 4x4 affine into a command list's coordinates.
+
+    Counterpart of :func:`apply_transformation` for callers that already
+    flattened a wrapper chain with matrix multiplies (see
+    :func:`generate_gcode_segment`).
+    """
+    move_indices, pts = _extract_move_points(gcode_commands)
+    if not move_indices:
+        return gcode_commands
+    transformed = np.asarray(pts, dtype=np.float64) @ M[:3, :3].T + M[:3, 3]
+    return _rewrite_moves(gcode_commands, move_indices, transformed)
+
+
+def _valid_dicts(entries, label):
+    """Filter a modifiers/constraints list down to its dict entries.
+
+    Validating once up front lets the apply loops run without a per-item
+    isinstance check; malformed entries get a single summary warning
+    instead of silently vanishing one at a time.
+    """
+    valid = [entry for entry in entries if isinstance(entry, dict)]
+    dropped = len(entries) - len(valid)
+    if dropped:
+        logger.warning("Ignoring %d malformed %s entries (expected dicts)",
+                       dropped, label)
+    return valid
+
+
+def apply_modifier(gcode_commands, modifier, segment):
+    """Apply a global modifier to the G-code, mutating the list in place.
+
+    Currently annotates the program; real parameter rewriting belongs to the
+    AI optimizer.  Appending in place keeps the global-ops passes O(N + M)
+    instead of copying the whole program once per modifier.
+    """
+    modifier_type = modifier.get("type", "unknown")
+    gcode_commands.append(f"; modifier applied: {modifier_type}")
+
+
+def apply_constraint(gcode_commands, constraint, segment):
+    """Apply a global constraint annotation in place; see :func:`apply_modifier`."""
+    constraint_type = constraint.get("type", "unknown")
+    gcode_commands.append(f"; constraint applied: {constraint_type}")
+
+
+def iter_filter_redundant_moves(gcode_commands):
+    """Stream variant of :func:`filter_redundant_moves`: filters any iterable
+    of commands with O(1) state."""
+    position = {"X": None, "Y": None, "Z": None}
+    for command in gcode_commands:
+        parts = command.split()
+        if not parts or parts[0] not in ("G0", "G1"):
+            # Arcs still move the nozzle: fold their endpoint into the
+            # tracked position so the next linear move is judged against
+            # where the head actually is.
+            if parts and parts[0] in ("G2", "G3"):
+                for part in parts[1:]:
+                    axis = part[:1]
+                    if axis in ("X", "Y", "Z") and len(part) > 1:
+                        try:
+                            position[axis] = float(part[1:])
+                        except ValueError:
+                            continue
+            yield command
+            continue
+        target = dict(position)
+        has_axis = False
+        has_other = False
+        for part in parts[1:]:
+            axis = part[:1]
+            if axis in ("X", "Y", "Z") and len(part) > 1:
+                try:
+                    target[axis] = float(part[1:])
+                except ValueError:
+                    has_other = True
+                    continue
+                has_axis = True
+            else:
+                has_other = True
+        # A move that goes nowhere but carries another word (a new F or
+        # an E-only retract) still changes machine state: keep it.
+        if has_axis and not has_other and target == position:
+            continue
+        position = target
+        yield command
+
+
+def filter_redundant_moves(gcode_commands):
+    """Drop moves that do not change the current position.
+
+    Tracks X/Y/Z across G0/G1 commands and removes commands whose target
+    equals the position already reached.
+    """
+    return list(iter_filter_redundant_moves(gcode_commands))
+
+
+def compress_modal(lines):
+    """Suppress words that just repeat the current modal state.
+
+    G0/G1, F, S and the axis words are modal: firmwares reuse the previous
+    value for any word a line omits.  One pass tracks the last emitted word
+    per letter (and the last G-word) and rebuilds each move line from only
+    the words that changed, typically shrinking output 30-60%.  Lines that
+    end up adding nothing are dropped; non-linear-move lines pass through
+    untouched and do not disturb the state.
+    """
+    out = []
+    append = out.append
+    last_cmd = None
+    last_words = {}
+    for line in lines:
+        parts = line.split()
+        if not parts or parts[0] not in ("G0", "G1"):
+            # Arcs pass through verbatim but are modal too: they switch
+            # the motion mode and move every word they carry, so fold
+            # them into the state or the next move compresses against a
+            # stale mode and position.
+            if parts and parts[0] in ("G2", "G3"):
+                last_cmd = parts[0]
+                for word in parts[1:]:
+                    last_words[word[0]] = word
+            append(line)
+            continue
+        cmd = parts[0]
+        changed_words = []
+        for word in parts[1:]:
+            key = word[0]
+            if last_words.get(key) != word:
+                changed_words.append(word)
+                last_words[key] = word
+        if cmd == last_cmd:
+            if changed_words:
+                append(" ".join(changed_words))
+        else:
+            # Keep the G-word on mode switches even with no new values so
+            # later bare-axis lines bind to the right motion mode.
+            last_cmd = cmd
+            changed_words.insert(0, cmd)
+            append(" ".join(changed_words))
+    return out
+
+
+# Arc-fit output templates; the tail carries any shared Z/F/E words of the
+# fused run verbatim.
+_G2_ARC_FMT = "G2 X%s Y%s I%s J%s"
+_G3_ARC_FMT = "G3 X%s Y%s I%s J%s"
+# Fits flatter than this radius are chord noise on a near-straight path,
+# not a real arc; leave those as G1 runs.
+_ARC_FIT_MAX_RADIUS = 1e4
+
+
+def _circle_through(ax, ay, bx, by, cx, cy):
+    """Circumcenter and radius of three points, or None when collinear."""
+    d = 2.0 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+    a2 = ax * ax + ay * ay
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+    uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+    return ux, uy, math.hypot(ax - ux, ay - uy)
+
+
+def _fit_arc_at(pts, a, tolerance):
+    """Greedy circular fit anchored at ``pts[a]``.
+
+    Fits a circle through the anchor and the next two points, then extends
+    while further points stay within ``tolerance`` of it and keep turning
+    the same way.  Returns ``(end, arc_words)`` covering at least three
+    chords — so one emitted arc always replaces several lines — or None.
+    """
+    ax, ay = pts[a]
+    bx, by = pts[a + 1]
+    ex, ey = pts[a + 2]
+    circle = _circle_through(ax, ay, bx, by, ex, ey)
+    if circle is None:
+        return None
+    cx, cy, radius = circle
+    if radius > _ARC_FIT_MAX_RADIUS:
+        return None
+    turn = (bx - ax) * (ey - by) - (by - ay) * (ex - bx)
+    end = a + 2
+    while end + 1 < len(pts):
+        qx, qy = pts[end + 1]
+        if abs(math.hypot(qx - cx, qy - cy) - radius) > tolerance:
+            break
+        px, py = pts[end]
+        ox, oy = pts[end - 1]
+        if ((px - ox) * (qy - py) - (py - oy) * (qx - px)) * turn <= 0.0:
+            break
+        end += 1
+    if end - a < 3:
+        return None
+    fmt = _G3_ARC_FMT if turn > 0.0 else _G2_ARC_FMT
+    tx, ty = pts[end]
+    return end, fmt % (
+        format_coord(tx),
+        format_coord(ty),
+        format_coord(cx - ax),
+        format_coord(cy - ay),
+    )
+
+
+def fit_arcs(lines, tolerance=0.05):
+    """Fuse runs of planar G1 chords lying on a common circle into G2/G3.
+
+    Sampled curves (arcs re-imported as polylines, beziers, spirals) emit
+    many short G1 chords; one arc word streams and executes as a single
+    firmware motion.  A run is a sequence of G1 lines sharing identical
+    non-XY words (Z/F/E), so extrusion and feed semantics are preserved —
+    any other line breaks the run.  ``tolerance`` is the maximum radial
+    deviation in millimeters; fused output can be 5-20x smaller on curved
+    paths.
+    """
+    out = []
+    pts = []
+    raw = []
+    run_tail = None
+
+    def flush():
+        n = len(pts)
+        if n < 4:
+            out.extend(raw)
+        else:
+            a = 0
+            out.append(raw[0])
+            while a < n - 1:
+                fitted = _fit_arc_at(pts, a, tolerance) if n - a >= 4 else None
+                if fitted is None:
+                    a += 1
+                    out.append(raw[a])
+                else:
+                    a, arc_line = fitted
+                    if run_tail:
+                        arc_line = "%s %s" % (arc_line, run_tail)
+                    out.append(arc_line)
+        pts.clear()
+        raw.clear()
+
+    for line in lines:
+        parts = line.split()
+        tail = None
+        if (
+            len(parts) >= 3
+            and parts[0] == "G1"
+            and parts[1][:1] == "X"
+            and parts[2][:1] == "Y"
+            and all(word[:1] in ("Z", "F", "E") for word in parts[3:])
+        ):
+            tail = " ".join(parts[3:])
+        if tail is None or (pts and tail != run_tail):
+            flush()
+            run_tail = tail
+        if tail is None:
+            out.append(line)
+            continue
+        run_tail = tail
+        try:
+            pts.append((float(parts[1][1:]), float(parts[2][1:])))
+        except ValueError:
+            flush()
+            out.append(line)
+            continue
+        raw.append(line)
+    flush()
+    return out
+
+
+@njit(cache=True)
+def _arc_start_and_need_move(cx, cy, cz, radius, start_deg, px, py, pz,
+                             rtol, atol):
+    """Arc start point plus whether a travel pre-move is needed.
+
+    All-scalar kernel so the per-arc trig and the three closeness checks
+    compile to straight machine code; the tolerance test is the plain
+    ``abs(a - b) <= atol + rtol * abs(b)`` form rather than math.isclose.
+    """
+    angle = math.radians(start_deg)
+    sx = cx + radius * math.cos(angle)
+    sy = cy + radius * math.sin(angle)
+    sz = cz
+    need_move = (
+        abs(px - sx) > atol + rtol * abs(sx)
+        or abs(py - sy) > atol + rtol * abs(sy)
+        or abs(pz - sz) > atol + rtol * abs(sz)
+    )
+    return sx, sy, sz, need_move
+
+
+if _HAVE_NUMBA:
+    # Pre-warm so the first arc segment doesn't pay compilation latency.
+    _arc_start_and_need_move(0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1e-9, 0.0)
+
+
+def _segment_end_point(segment):
+    """Analytic end point of a primitive segment, or None when unknown.
+
+    Knowing where a primitive ends from its own parameters beats re-parsing
+    the last emitted line: no tokenizing, and no precision loss through the
+    %.3f round trip.  Transformed segments return None because the emitted
+    coordinates no longer match the raw parameters, as do wrapper types
+    whose geometry lives in nested segments.
+    """
+    if segment.get("transform"):
+        return None
+    segment_type = segment.get("type")
+    if segment_type == "line":
+        end = segment.get("end", _ORIGIN)
+        return float(end[0]), float(end[1]), float(end[2])
+    if segment_type == "arc":
+        center = segment.get("center", _ORIGIN)
+        radius = segment.get("radius", 1.0)
+        end_angle = math.radians(segment.get("end_angle", 90.0))
+        return (
+            center[0] + radius * math.cos(end_angle),
+            center[1] + radius * math.sin(end_angle),
+            float(center[2]),
+        )
+    if segment_type == "bezier":
+        control_points = segment.get("control_points")
+        if control_points:
+            last = control_points[-1]
+            return float(last[0]), float(last[1]), float(last[2])
+        return None
+    if segment_type == "spiral":
+        center = segment.get("center", _ORIGIN)
+        outer_radius = segment.get("outer_radius", 5.0)
+        turns = segment.get("turns", 3.0)
+        pitch = segment.get("pitch", 0.2)
+        total_angle = 2.0 * math.pi * turns
+        return (
+            center[0] + outer_radius * math.cos(total_angle),
+            center[1] + outer_radius * math.sin(total_angle),
+            center[2] + turns * pitch,
+        )
+    return None
+
+
+def _finalize(lines):
+    """Fused finalization: redundant-move filtering plus modal compression.
+
+    Both passes walk every line with O(1) state, so running them back to
+    back doubles the memory traffic of the finalization stage; this does
+    one walk carrying both state machines, writing through a cursor into a
+    preallocated output list trimmed once at the end.  Behaves exactly like
+    ``compress_modal(filter_redundant_moves(lines))``.
+    """
+    out = [None] * len(lines)
+    cursor = 0
+    position = {"X": None, "Y": None, "Z": None}
+    last_cmd = None
+    last_words = {}
+    for line in lines:
+        parts = line.split()
+        if not parts or parts[0] not in ("G0", "G1"):
+            # Arcs pass through verbatim but advance both state
+            # machines: they move to their X/Y/Z endpoint and switch
+            # the modal motion mode.
+            if parts and parts[0] in ("G2", "G3"):
+                for part in parts[1:]:
+                    axis = part[:1]
+                    if axis in ("X", "Y", "Z") and len(part) > 1:
+                        try:
+                            position[axis] = float(part[1:])
+                        except ValueError:
+                            continue
+                last_cmd = parts[0]
+                for word in parts[1:]:
+                    last_words[word[0]] = word
+            out[cursor] = line
+            cursor += 1
+            continue
+        cmd = parts[0]
+
+        # Redundancy: drop moves whose target equals the position reached,
+        # unless the line also carries a non-axis word (F/E/S) — those
+        # change machine state even when the head stays put.
+        target = dict(position)
+        has_axis = False
+        has_other = False
+        for part in parts[1:]:
+            axis = part[:1]
+            if axis in ("X", "Y", "Z") and len(part) > 1:
+                try:
+                    target[axis] = float(part[1:])
+                except ValueError:
+                    has_other = True
+                    continue
+                has_axis = True
+            else:
+                has_other = True
+        if has_axis and not has_other and target == position:
+            continue
+        position = target
+
+        # Modal compression: keep only the words whose value changed.
+        changed_words = []
+        for word in parts[1:]:
+            key = word[0]
+            if last_words.get(key) != word:
+                changed_words.append(word)
+                last_words[key] = word
+        if cmd == last_cmd:
+            if changed_words:
+                out[cursor] = " ".join(changed_words)
+                cursor += 1
+        else:
+            last_cmd = cmd
+            changed_words.insert(0, cmd)
+            out[cursor] = " ".join(changed_words)
+            cursor += 1
+    del out[cursor:]
+    return out
+
+
+def _precompute_arc_starts(segments_data):
+    """Compute the start points of every arc segment in one vectorized pass.
+
+    Gathers all arc centers/radii/start angles into contiguous arrays and
+    evaluates the trig as whole-array cos/sin, so a program with thousands
+    of arcs does no per-segment trig in the main loop.  Returns a segment
+    index -> (x, y, z) dict (empty when the program has no arcs).
+    """
+    indices = [
+        i for i, segment in enumerate(segments_data)
+        if isinstance(segment, dict) and segment.get("type") == "arc"
+    ]
+    if not indices:
+        return {}
+    centers = np.array(
+        [segments_data[i].get("center", _ORIGIN) for i in indices],
+        dtype=np.float64,
+    )
+    radii = np.array(
+        [segments_data[i].get("radius", 1.0) for i in indices], dtype=np.float64
+    )
+    angles = np.deg2rad(np.array(
+        [segments_data[i].get("start_angle", 0.0) for i in indices],
+        dtype=np.float64,
+    ))
+    xs = centers[:, 0] + radii * np.cos(angles)
+    ys = centers[:, 1] + radii * np.sin(angles)
+    zs = centers[:, 2]
+    return {
+        i: (x, y, z)
+        for i, x, y, z in zip(indices, xs.tolist(), ys.tolist(), zs.tolist())
+    }
+
+
+def _g0_line(x, y, z, current_z):
+    """Render a rapid travel move, omitting the Z word when it is unchanged.
+
+    Planar paths (the common case) then emit two-axis travel lines, saving
+    both the Z formatting work and the bytes on every pre-move.
+    """
+    if abs(z - current_z) <= _POS_EPS:
+        return _G0_XY_FMT % (format_coord(x), format_coord(y))
+    return _G0_XYZ_FMT % (format_coord(x), format_coord(y), format_coord(z))
+
+
+def _iter_segment_lines(segments_data, state, arc_starts=None, pregenerated=None):
+    """Yield movement lines for all segments, including travel pre-moves.
+
+    ``state`` is a mutable dict used to report the last processed segment
+    back to the caller for the global modifier/constraint passes.
+    ``arc_starts`` optionally carries pre-vectorized arc start points from
+    :func:`_precompute_arc_starts`; arcs not covered fall back to the
+    scalar kernel.  ``pregenerated`` optionally carries per-segment line
+    lists from :func:`_generate_segments_parallel` (None entries marking
+    failed segments), leaving only the order-dependent pre-move/position
+    pass to run here.
+    """
+    # Nozzle position as three scalars: no 3-element list allocated and
+    # re-allocated per segment, and the comparisons below stay unboxed.
+    cx = cy = cz = 0.0
+
+    # No defensive copy per segment: everything downstream reads the dicts
+    # through .get and never mutates them.
+    for i, segment_dict in enumerate(segments_data):
+        segment_type = segment_dict.get("type")
+        if segment_type is None:
+            logger.error("Segment %d has no type: %s", i, segment_dict)
+            continue
+
+        # Rapid pre-move to the segment start when we are not already there.
+        if segment_type == "line":
+            start = segment_dict.get("start", _ORIGIN)
+            # Inline absolute-difference tests: three math.isclose calls per
+            # segment cost more than the comparison itself.
+            if (abs(cx - start[0]) > _POS_EPS
+                    or abs(cy - start[1]) > _POS_EPS
+                    or abs(cz - start[2]) > _POS_EPS):
+                yield _g0_line(start[0], start[1], start[2], cz)
+        elif segment_type == "arc":
+            precomputed = arc_starts.get(i) if arc_starts else None
+            if precomputed is not None:
+                arc_start_x, arc_start_y, arc_start_z = precomputed
+                need_move = (
+                    abs(cx - arc_start_x) > _POS_EPS
+                    or abs(cy - arc_start_y) > _POS_EPS
+                    or abs(cz - arc_start_z) > _POS_EPS
+                )
+            else:
+                center = segment_dict.get("center", _ORIGIN)
+                radius = segment_dict.get("radius", 1.0)
+                arc_start_x, arc_start_y, arc_start_z, need_move = (
+                    _arc_start_and_need_move(
+                        float(center[0]), float(center[1]), float(center[2]),
+                        float(radius),
+                        float(segment_dict.get("start_angle", 0.0)),
+                        cx, cy, cz,
+                        0.0, _POS_EPS,
+                    )
+                )
+            if need_move:
+                yield _g0_line(arc_start_x, arc_start_y, arc_start_z, cz)
+
+        if pregenerated is not None:
+            segment_gcode = pregenerated[i]
+            if segment_gcode is None:
+                logger.error("Failed to generate segment %d: %s", i, segment_dict)
+                continue
+        else:
+            try:
+                segment_gcode = generate_gcode_segment(segment_dict)
+            except ValueError as exc:
+                logger.error("Failed to generate segment %d: %s", i, exc)
+                continue
+        yield from segment_gcode
+
+        # Track the nozzle position: analytically from the segment's own
+        # parameters when possible, otherwise by parsing the last movement
+        # command emitted.
+        if segment_gcode:
+            end_point = _segment_end_point(segment_dict)
+            if end_point is not None:
+                cx, cy, cz = end_point
+            else:
+                last_cmd_in_segment = segment_gcode[-1]
+                # Our own emitters only produce uppercase words, so one C
+                # regex scan replaces the split/slice/float token loop.
+                if last_cmd_in_segment.startswith(_MOVE_PREFIXES):
+                    temp_pos = [cx, cy, cz]
+                    for axis, value in _AXIS_RE.findall(last_cmd_in_segment):
+                        temp_pos["XYZ".index(axis)] = float(value)
+                    cx, cy, cz = temp_pos
+        state["last_segment"] = segment_dict
+
+
+def generate_gcode_from_json(json_input, stream=False, arc_tolerance=None):
+    """Generate a full G-code program from a JSON path description.
+
+    Returns the program as a list of command strings; callers that need the
+    final text should join once at the boundary via :func:`gcode_to_text`.
+    With ``stream=True`` an iterator of lines is returned instead
+    (delegating to :func:`generate_gcode_stream`), keeping O(1) lines
+    resident for very large programs.  ``arc_tolerance`` opts into the
+    :func:`fit_arcs` post-pass, fusing sampled-curve chords into G2/G3
+    within the given radial tolerance; it stays off by default because the
+    rewrite trades exact chords for arcs.
+    """
+    if stream:
+        return generate_gcode_stream(json_input)
+    path_info = parse_json_input(json_input)
+    segments_data = path_info.get("segments", [])
+
+    gcode_output = [_G21, _G90]
+    state = {}
+    # Large jobs fan segment emission out to worker processes; the ordered
+    # results feed the same serial pre-move pass below.
+    pregenerated = None
+    if len(segments_data) >= _PARALLEL_MIN_SEGMENTS:
+        pregenerated = _generate_segments_parallel(segments_data)
+    # Extend straight from the generator: segment lines land in the one
+    # output list without being materialized in a temporary first.  Arc
+    # start points are batch-computed up front so the loop does no trig.
+    gcode_output.extend(_iter_segment_lines(
+        segments_data, state,
+        arc_starts=_precompute_arc_starts(segments_data),
+        pregenerated=pregenerated,
+    ))
+    last_processed_segment_for_global_ops = state.get("last_segment")
+
+    for modifier_dict in _valid_dicts(path_info.get("modifiers", []), "modifier"):
+        apply_modifier(
+            gcode_output, modifier_dict, last_processed_segment_for_global_ops
+        )
+    for constraint_dict in _valid_dicts(
+        path_info.get("constraints", []), "constraint"
+    ):
+        apply_constraint(
+            gcode_output, constraint_dict, last_processed_segment_for_global_ops
+        )
+
+    if arc_tolerance is not None:
+        # Fit before modal compression: the fitter needs full X/Y words,
+        # which compression would strip from unchanged axes.
+        gcode_output = fit_arcs(
+            filter_redundant_moves(gcode_output), arc_tolerance
+        )
+    gcode_output = _finalize(gcode_output)
+    gcode_output.append(_M2)
+    return gcode_output
+
+
+def generate_gcode_stream(json_input):
+    """Yield a full G-code program line by line.
+
+    Keeps O(1) lines resident instead of materializing the whole program,
+    so callers can pipe straight to a file, socket or printer host.  The
+    redundant-move filter runs inline on the stream.
+    """
+    path_info = parse_json_input(json_input)
+    state = {}
+
+    yield _G21
+    yield _G90
+    yield from iter_filter_redundant_moves(
+        _iter_segment_lines(path_info.get("segments", []), state)
+    )
+    last_segment = state.get("last_segment")
+    tail = []
+    for modifier_dict in _valid_dicts(path_info.get("modifiers", []), "modifier"):
+        apply_modifier(tail, modifier_dict, last_segment)
+    for constraint_dict in _valid_dicts(
+        path_info.get("constraints", []), "constraint"
+    ):
+        apply_constraint(tail, constraint_dict, last_segment)
+    yield from tail
+    yield _M2
+
+
+async def generate_gcode_stream_async(json_input, queue):
+    """Produce the program into an :class:`asyncio.Queue`, line by line.
+
+    Give the queue a ``maxsize`` and a full buffer suspends *generation*
+    until the consumer — typically a printer host pacing itself on the
+    firmware's planner state — drains it, so printing starts before
+    generation finishes and wall-clock cost collapses toward
+    ``max(generate, print)`` instead of their sum.  A final ``None``
+    marks end of program.
+    """
+    for line in generate_gcode_stream(json_input):
+        await queue.put(line)
+    await queue.put(None)
+
+
+# One pattern per axis: the final value of a modal axis is just the last
+# axis word on any movement line, so three C-level scans over the joined
+# buffer replace a per-line Python tracking loop.  Movement lines come in
+# two shapes after finalization: full G0..G3 lines, and the bare
+# continuation lines modal compression leaves when it drops the G-word —
+# those consist solely of space-separated words, so the second branch
+# skips leading non-target words explicitly (no lookaround; the pattern
+# must stay re2-compatible).
+_FINAL_AXIS_RES = {
+    axis: _scan_re.compile(
+        r"(?m)^(?:G[0-3][^;\n]*?|(?:[XYZEFS]-?\d+(?:\.\d+)? )*)%s(-?\d+(?:\.\d+)?)"
+        % axis
+    )
+    for axis in "XYZ"
+}
+
+
+def final_position(gcode_commands):
+    """Final (x, y, z) of a generated program in one pass over its text.
+
+    For callers that need the end state of an already-rendered program
+    (chaining jobs, resuming prints); the generator itself tracks
+    positions analytically while emitting.  Axes never moved report 0.0.
+    """
+    buf = "\n".join(gcode_commands)
+    position = []
+    for axis in "XYZ":
+        matches = _FINAL_AXIS_RES[axis].findall(buf)
+        position.append(float(matches[-1]) if matches else 0.0)
+    return tuple(position)
+
+
+def gcode_to_text(gcode_commands):
+    """Serialize a command list to program text with one join at the boundary."""
+    return "\n".join(gcode_commands) + "\n"
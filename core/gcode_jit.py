@@ -0,0 +1,91 @@
+"""Compiled kernels for array-resident G-code passes.
+
+The string pipeline in :mod:`core.gcode_generator` keeps its fused pure
+Python finalizer, which is already single-pass; these kernels serve
+callers that hold a program in columnar (SoA) form — ``codes`` plus one
+float column per axis, with NaN marking an absent word — and want the
+per-line filtering loops compiled instead of interpreted.  With numba
+missing the kernels still run as plain Python over NumPy scalars.
+"""
+
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # numba is an optional speed dependency
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in so the jitted kernels stay importable without numba."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Command codes for the SoA representation: travel/print moves get their
+# G-number, anything else is opaque to the kernels.
+CODE_G0 = 0
+CODE_G1 = 1
+CODE_OTHER = -1
+
+
+@njit(cache=True)
+def _filter_moves(codes, xs, ys, zs, keep):
+    """Mark redundant G0/G1 lines in ``keep`` (True = retain the line).
+
+    Mirrors :func:`core.gcode_generator.filter_redundant_moves`: a move
+    that names at least one axis but leaves the tracked X/Y/Z position
+    unchanged is dropped.  NaN means "word absent" in the columns and
+    "axis never set" in the tracked position.
+    """
+    px = py = pz = np.nan
+    for i in range(codes.shape[0]):
+        if codes[i] < 0:
+            keep[i] = True
+            continue
+        x = xs[i]
+        y = ys[i]
+        z = zs[i]
+        has_axis = not (math.isnan(x) and math.isnan(y) and math.isnan(z))
+        tx = px if math.isnan(x) else x
+        ty = py if math.isnan(y) else y
+        tz = pz if math.isnan(z) else z
+        same = (
+            (tx == px or (math.isnan(tx) and math.isnan(px)))
+            and (ty == py or (math.isnan(ty) and math.isnan(py)))
+            and (tz == pz or (math.isnan(tz) and math.isnan(pz)))
+        )
+        if has_axis and same:
+            keep[i] = False
+        else:
+            px = tx
+            py = ty
+            pz = tz
+            keep[i] = True
+
+
+def filter_moves_mask(codes, xs, ys, zs):
+    """Return a boolean keep-mask over a columnar program.
+
+    Thin allocating wrapper around the :func:`_filter_moves` kernel; the
+    caller applies the mask to whatever per-line payload it carries.
+    """
+    keep = np.empty(codes.shape[0], dtype=np.bool_)
+    _filter_moves(codes, xs, ys, zs, keep)
+    return keep
+
+
+if _HAVE_NUMBA:
+    # Trigger compilation at import so the first real program does not pay
+    # the JIT cost; cache=True keeps it across processes.
+    _filter_moves(
+        np.zeros(1, dtype=np.int8),
+        np.zeros(1),
+        np.zeros(1),
+        np.zeros(1),
+        np.empty(1, dtype=np.bool_),
+    )
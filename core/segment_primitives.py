@@ -0,0 +1,373 @@
+"""Primitive G-code emitters for the basic path segment types.
+
+Each generator takes a segment dict (as found in the ``paths`` section of a
+TotalControl JSON description) and returns a list of G-code command strings.
+Higher-level sequencing (pre-moves, transforms, repeats) lives in
+``core.gcode_generator``.
+"""
+
+import cmath
+import functools
+import logging
+import math
+
+try:
+    import numpy as np
+
+    _HAVE_NUMPY = True
+except ImportError:  # pure-Python fallbacks below keep the module usable
+    np = None
+    _HAVE_NUMPY = False
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:  # numba is an optional speed dependency
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in so the jitted kernels stay importable without numba."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEEDRATE = 1500
+DEFAULT_EXTRUSION_RATE = 0.05
+
+# Shared read-only default triple: dict.get defaults written inline as
+# [0.0, 0.0, 0.0] allocate a throwaway list on every call.
+_ORIGIN = (0.0, 0.0, 0.0)
+
+# Cached move templates: %-formatting of floats avoids re-parsing a format
+# spec per line and benchmarks faster than f-strings in hot loops.
+_G1_MOVE_FMT = "G1 X%.3f Y%.3f Z%.3f F%s E%s"
+
+
+def format_coord(value):
+    """Format a coordinate to 3 decimals with trailing zeros trimmed.
+
+    "X0.000" carries no more information than "X0" but triples the bytes
+    through every downstream pipe; this is the hand-rolled equivalent of
+    ``np.format_float_positional(value, precision=3, unique=False,
+    trim='0')`` using only C-level string ops.
+    """
+    text = ("%.3f" % value).rstrip("0")
+    return text[:-1] if text[-1] == "." else text
+
+
+class ModalEmitter:
+    """Builds movement lines while suppressing modal tokens.
+
+    F, E and Z are modal: the printer keeps the last value until told
+    otherwise, so repeating them on every line only bloats the program and
+    the serial link.  The G-word is kept on every line so downstream passes
+    can still classify commands with a prefix check.  A move that changes
+    nothing at all — same X/Y target and no new modal values — returns
+    None, so dense samplings never emit no-op lines for the global
+    redundancy filter to remove later.
+    """
+
+    __slots__ = ("last_cmd", "last_x", "last_y", "last_f", "last_e", "last_z")
+
+    def __init__(self):
+        self.last_cmd = None
+        self.last_x = None
+        self.last_y = None
+        self.last_f = None
+        self.last_e = None
+        self.last_z = None
+
+    def emit(self, cmd, x, y, z=None, f=None, e=None):
+        """Return one movement line containing only the tokens that changed,
+        or None for a complete no-op."""
+        parts = [cmd, "X%.3f" % x, "Y%.3f" % y]
+        changed = x != self.last_x or y != self.last_y
+        if z is not None and z != self.last_z:
+            parts.append("Z%.3f" % z)
+            self.last_z = z
+            changed = True
+        if f is not None and f != self.last_f:
+            parts.append("F%s" % f)
+            self.last_f = f
+            changed = True
+        if e is not None and e != self.last_e:
+            parts.append("E%s" % e)
+            self.last_e = e
+            changed = True
+        if not changed:
+            return None
+        self.last_x = x
+        self.last_y = y
+        self.last_cmd = cmd
+        return " ".join(parts)
+
+
+@njit(cache=True, fastmath=True)
+def _compute_points_spiral(cx, cy, cz, inner_radius, outer_radius, turns, pitch, n):
+    """Numeric kernel for spiral sampling; returns an (n, 3) float64 array."""
+    out = np.empty((n, 3))
+    total_angle = turns * 2.0 * math.pi
+    dr = outer_radius - inner_radius
+    dz = turns * pitch
+    inv = 1.0 / (n - 1) if n > 1 else 0.0
+    for i in range(n):
+        frac = i * inv
+        angle = frac * total_angle
+        radius = inner_radius + frac * dr
+        out[i, 0] = cx + radius * math.cos(angle)
+        out[i, 1] = cy + radius * math.sin(angle)
+        out[i, 2] = cz + frac * dz
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def _compute_points_bezier(coeffs, n):
+    """Numeric Horner kernel for power-basis coefficients (low order first)."""
+    order = coeffs.shape[0]
+    out = np.empty((n, 3))
+    inv = 1.0 / (n - 1) if n > 1 else 0.0
+    for i in range(n):
+        t = i * inv
+        for axis in range(3):
+            acc = coeffs[order - 1, axis]
+            for row in range(order - 2, -1, -1):
+                acc = acc * t + coeffs[row, axis]
+            out[i, axis] = acc
+    return out
+
+
+if _HAVE_NUMBA:
+    # Warm the JIT cache at import so the first user-facing call does not
+    # pay compile latency.
+    _compute_points_spiral(0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 0.2, 2)
+    _compute_points_bezier(np.zeros((3, 3)), 2)
+
+
+def generate_gcode_line(segment):
+    """Generate G-code for a straight line segment.
+
+    Expects ``start`` and ``end`` as [x, y, z] triples.
+    """
+    start = segment.get("start", _ORIGIN)
+    end = segment.get("end", _ORIGIN)
+    feedrate = segment.get("feedrate", DEFAULT_FEEDRATE)
+    extrusion = segment.get("extrusion_rate", DEFAULT_EXTRUSION_RATE)
+
+    gcode_commands = [_G1_MOVE_FMT % (end[0], end[1], end[2], feedrate, extrusion)]
+    logger.debug("Generated line segment from %s to %s", start, end)
+    return gcode_commands
+
+
+def generate_gcode_arc(segment):
+    """Generate G-code for a circular arc segment using G2/G3.
+
+    The I/J offsets are the arc center relative to the arc start point.
+    """
+    center = segment.get("center", _ORIGIN)
+    radius = segment.get("radius", 1.0)
+    start_angle = math.radians(segment.get("start_angle", 0.0))
+    end_angle = math.radians(segment.get("end_angle", 90.0))
+    clockwise = segment.get("direction", "ccw") == "cw"
+    feedrate = segment.get("feedrate", DEFAULT_FEEDRATE)
+    extrusion = segment.get("extrusion_rate", DEFAULT_EXTRUSION_RATE)
+
+    start_x = center[0] + radius * math.cos(start_angle)
+    start_y = center[1] + radius * math.sin(start_angle)
+    end_x = center[0] + radius * math.cos(end_angle)
+    end_y = center[1] + radius * math.sin(end_angle)
+    # I/J are the center relative to the arc *start* point, never relative to
+    # the center itself (which would always collapse to 0.0).
+    i_offset = center[0] - start_x
+    j_offset = center[1] - start_y
+
+    command = "G2" if clockwise else "G3"
+    gcode_commands = [
+        f"{command} X{end_x:.3f} Y{end_y:.3f} "
+        f"I{i_offset:.3f} J{j_offset:.3f} "
+        f"F{feedrate} E{extrusion}"
+    ]
+    logger.debug("Generated arc segment around %s radius %s", center, radius)
+    return gcode_commands
+
+
+# Coefficient matrices mapping control points to power-basis coefficients
+# for the two degrees that dominate real inputs.  Row i holds the weights of
+# the t**i monomial.
+if _HAVE_NUMPY:
+    _QUADRATIC_COEFFS = np.array(
+        [[1.0, 0.0, 0.0], [-2.0, 2.0, 0.0], [1.0, -2.0, 1.0]]
+    )
+    _CUBIC_COEFFS = np.array(
+        [
+            [1.0, 0.0, 0.0, 0.0],
+            [-3.0, 3.0, 0.0, 0.0],
+            [3.0, -6.0, 3.0, 0.0],
+            [-1.0, 3.0, -3.0, 1.0],
+        ]
+    )
+
+
+def _bezier_points_complex(control_points, n):
+    """Pure-Python Bezier sampling for when NumPy is unavailable.
+
+    XY pairs are packed into one complex number each so the inner loop runs
+    native complex add/multiply instead of building tuples per point.
+    """
+    degree = len(control_points) - 1
+    pts_xy = [complex(p[0], p[1]) for p in control_points]
+    zs = [p[2] for p in control_points]
+    binom = [math.comb(degree, k) for k in range(degree + 1)]
+    inv = 1.0 / (n - 1) if n > 1 else 0.0
+    out = []
+    for i in range(n):
+        t = i * inv
+        u = 1.0 - t
+        p = 0j
+        z = 0.0
+        for k in range(degree + 1):
+            w = binom[k] * u ** (degree - k) * t**k
+            p += w * pts_xy[k]
+            z += w * zs[k]
+        out.append((p.real, p.imag, z))
+    return out
+
+
+def _spiral_points_complex(cx, cy, cz, inner_radius, outer_radius,
+                           turns, pitch, n):
+    """Pure-Python spiral sampling for when NumPy is unavailable."""
+    center = complex(cx, cy)
+    total_angle = turns * 2.0 * math.pi
+    dr = outer_radius - inner_radius
+    dz = turns * pitch
+    inv = 1.0 / (n - 1) if n > 1 else 0.0
+    exp = cmath.exp
+    out = []
+    for i in range(n):
+        frac = i * inv
+        p = center + (inner_radius + frac * dr) * exp(1j * frac * total_angle)
+        out.append((p.real, p.imag, cz + frac * dz))
+    return out
+
+
+@functools.lru_cache(maxsize=64)
+def _bezier_basis_matrix(degree, num_points):
+    """Return the (num_points, degree + 1) Bernstein basis matrix.
+
+    Evaluating a curve is then a single ``M @ control_points`` matrix
+    multiply.  The matrix only depends on (degree, num_points), which repeat
+    across segments of the same shape, so it is cached at module level.
+    """
+    t = np.linspace(0.0, 1.0, num_points)[:, None]
+    k = np.arange(degree + 1)
+    binom = np.array([math.comb(degree, i) for i in k], dtype=np.float64)
+    return binom * t**k * (1.0 - t) ** (degree - k)
+
+
+def _evaluate_bezier(P, num_points):
+    """Evaluate a Bezier curve of any degree at ``num_points`` samples.
+
+    Quadratic and cubic curves go through hardcoded power-basis coefficient
+    matrices plus a Horner pass; higher degrees fall back to one Bernstein
+    basis matmul, which BLAS handles as a dense GEMM.
+    """
+    degree = len(P) - 1
+    if degree in (2, 3):
+        coeffs = _QUADRATIC_COEFFS if degree == 2 else _CUBIC_COEFFS
+        C = coeffs @ P  # power-basis coefficients, low order first
+        if _HAVE_NUMBA:
+            return _compute_points_bezier(C, num_points)
+        t = np.linspace(0.0, 1.0, num_points)[:, None]
+        xyz = C[-1]
+        for row in C[-2::-1]:
+            xyz = xyz * t + row
+        return xyz
+    return _bezier_basis_matrix(degree, num_points) @ P
+
+
+def generate_gcode_bezier(segment):
+    """Generate G-code for a Bezier curve segment of arbitrary degree.
+
+    The curve is evaluated for all sample parameters at once: quadratic and
+    cubic curves collapse into power-basis coefficients so each axis is a
+    single Horner evaluation over the full ``t`` array, and higher degrees
+    dispatch through a cached Bernstein basis matrix multiply.
+    """
+    control_points = segment.get("control_points")
+    if control_points is None or len(control_points) < 3:
+        logger.error("Bezier segment requires at least 3 control points: %s", segment)
+        return []
+    num_points = segment.get("num_points", 50)
+    feedrate = segment.get("feedrate", DEFAULT_FEEDRATE)
+    extrusion = segment.get("extrusion_rate", DEFAULT_EXTRUSION_RATE)
+
+    if _HAVE_NUMPY:
+        P = np.asarray(control_points, dtype=np.float64)
+        points = _evaluate_bezier(P, num_points).tolist()
+    else:
+        points = _bezier_points_complex(control_points, num_points)
+
+    # Bind the emit method once: the comprehension then skips the attribute
+    # lookup on every line.  None entries are no-op moves on coincident
+    # sample points (degenerate control polygons) and are dropped here.
+    emit = ModalEmitter().emit
+    return [
+        line
+        for line in (emit("G1", x, y, z, feedrate, extrusion) for x, y, z in points)
+        if line is not None
+    ]
+
+
+def generate_gcode_spiral(segment):
+    """Generate G-code for a spiral segment.
+
+    The angle, radius and height ramps are computed as whole arrays so the
+    trig runs vectorized instead of once per sample point.
+    """
+    center = segment.get("center", _ORIGIN)
+    inner_radius = segment.get("inner_radius", 0.0)
+    outer_radius = segment.get("outer_radius", 5.0)
+    turns = segment.get("turns", 3.0)
+    pitch = segment.get("pitch", 0.2)
+    num_points = segment.get("num_points", 100)
+    feedrate = segment.get("feedrate", DEFAULT_FEEDRATE)
+    extrusion = segment.get("extrusion_rate", DEFAULT_EXTRUSION_RATE)
+
+    if _HAVE_NUMBA:
+        points = _compute_points_spiral(
+            center[0], center[1], center[2],
+            float(inner_radius), float(outer_radius),
+            float(turns), float(pitch), num_points,
+        ).tolist()
+    elif not _HAVE_NUMPY:
+        points = _spiral_points_complex(
+            center[0], center[1], center[2],
+            inner_radius, outer_radius, turns, pitch, num_points,
+        )
+    else:
+        # Loop invariants are computed exactly once; the per-sample work is
+        # a handful of whole-array operations.
+        total_angle = turns * 2.0 * math.pi
+        dr = outer_radius - inner_radius
+        dz = turns * pitch
+        frac = np.linspace(0.0, 1.0, num_points)
+        angles = frac * total_angle
+        radii = inner_radius + frac * dr
+        xyz = np.empty((num_points, 3))
+        xyz[:, 0] = center[0] + radii * np.cos(angles)
+        xyz[:, 1] = center[1] + radii * np.sin(angles)
+        xyz[:, 2] = center[2] + frac * dz
+        points = xyz.tolist()
+
+    # Bind the emit method once: the comprehension then skips the attribute
+    # lookup on every line.  None entries are no-op moves (e.g. a zero-radius,
+    # zero-pitch degenerate spiral) and are dropped here.
+    emit = ModalEmitter().emit
+    return [
+        line
+        for line in (emit("G1", x, y, z, feedrate, extrusion) for x, y, z in points)
+        if line is not None
+    ]
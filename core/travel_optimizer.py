@@ -0,0 +1,657 @@
+"""Travel-move optimizer for already-rendered G-code programs.
+
+Unlike :mod:`core.gcode_generator`, which emits programs from JSON path
+descriptions, this module post-processes arbitrary G-code — our own
+output or a slicer's: it splits the program into layers, groups each
+layer's motion into extrusion segments, reorders those segments with a
+nearest-neighbour pass so the nozzle travels less between them, then
+re-emits the program with fresh travel moves and redundant rapids
+removed.
+
+Reordering assumes extrusion amounts stay valid when runs swap places —
+true for relative extrusion (M83) and for this engine's output.  An
+absolute-E program would additionally need its E values renumbered
+after reordering, which this pass does not do.
+"""
+
+# PEP 604 unions in the LayerPlan annotations; keeps 3.9 (our floor) happy.
+from __future__ import annotations
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from core._gcode_opt_kernels import _HAVE_NUMBA, nn_order
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRAVEL_FEEDRATE = 9000
+# Minimum Z increase (mm) treated as a new layer rather than float noise.
+_LAYER_EPS = 1e-3
+# Positions closer than this (mm) count as "already there" for travel.
+_POS_EPS = 1e-3
+# Squared-distance form of the same budget, one comparison for all axes.
+_POS_EPS2 = 3.0 * _POS_EPS ** 2
+
+
+class GCodeCommand:
+    """One parsed G-code line: the raw text plus its extracted motion words."""
+
+    __slots__ = ("raw_line", "command_type", "params", "x", "y", "z", "e", "f")
+
+    def __init__(self, raw_line, command_type=None, params=None,
+                 x=None, y=None, z=None, e=None, f=None):
+        self.raw_line = raw_line
+        self.command_type = command_type
+        self.params = params if params is not None else {}
+        self.x = x
+        self.y = y
+        self.z = z
+        self.e = e
+        self.f = f
+
+    @classmethod
+    def parse(cls, line):
+        """Parse one line; comment-only and blank lines keep raw text only.
+
+        Motion lines take a fast path that writes the X/Y/Z/E/F slots
+        directly — no intermediate params dict, no dict lookups to fan the
+        values back out.  Only unrecognized motion words and non-motion
+        commands pay for the dict.
+        """
+        body = line.partition(";")[0]
+        parts = body.split()
+        if not parts:
+            return cls(line)
+        command_type = parts[0].upper()
+        cmd = cls(line, command_type=command_type)
+        if command_type in ("G0", "G1", "G2", "G3"):
+            for part in parts[1:]:
+                letter = part[0].upper()
+                try:
+                    value = float(part[1:])
+                except ValueError:
+                    continue
+                if letter == "X":
+                    cmd.x = value
+                elif letter == "Y":
+                    cmd.y = value
+                elif letter == "Z":
+                    cmd.z = value
+                elif letter == "E":
+                    cmd.e = value
+                elif letter == "F":
+                    cmd.f = value
+                else:
+                    cmd.params[letter] = value
+            return cmd
+        for part in parts[1:]:
+            try:
+                cmd.params[part[0].upper()] = float(part[1:])
+            except ValueError:
+                continue
+        return cmd
+
+    @property
+    def is_move(self):
+        # Arcs count: G2/G3 move the nozzle to their X/Y endpoint just
+        # like G1, and the grouping pass tracks position through them.
+        return self.command_type in ("G0", "G1", "G2", "G3")
+
+    @property
+    def is_extruding(self):
+        return (
+            self.command_type in ("G1", "G2", "G3")
+            and self.e is not None
+            and self.e > 0
+        )
+
+
+def parse_gcode_lines(lines):
+    """Parse a program into :class:`GCodeCommand` objects, one per line."""
+    return [GCodeCommand.parse(line) for line in lines]
+
+
+# Command codes for the columnar table.
+_CMD_CODES = {"G0": 0, "G1": 1, "G2": 2, "G3": 3}
+CMD_COMMENT = -1
+CMD_OTHER = -2
+
+
+class GCodeTable:
+    """Columnar (SoA) view of a parsed program.
+
+    One :class:`GCodeCommand` per line costs an object, a dict and boxed
+    floats each; the table instead keeps parallel NumPy columns — int8
+    command codes (G0..G3 as 0..3, comments -1, anything else -2), an
+    (N, 3) XYZ block and E/F columns with NaN for absent words, plus the
+    raw lines for verbatim re-emission.  Whole-program predicates then
+    run as array expressions over index ranges instead of attribute
+    chases through object lists.
+    """
+
+    __slots__ = ("raw_lines", "cmd_type", "xyz", "e", "f", "is_extruding")
+
+    def __init__(self, raw_lines, cmd_type, xyz, e, f, is_extruding):
+        self.raw_lines = raw_lines
+        self.cmd_type = cmd_type
+        self.xyz = xyz
+        self.e = e
+        self.f = f
+        self.is_extruding = is_extruding
+
+    def __len__(self):
+        return len(self.raw_lines)
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Parse a program into columns: grow Python lists, convert once."""
+        raw_lines = list(lines)
+        n = len(raw_lines)
+        cmd_type = np.full(n, CMD_OTHER, dtype=np.int8)
+        xyz = np.full((n, 3), np.nan)
+        e = np.full(n, np.nan)
+        f = np.full(n, np.nan)
+        for i, line in enumerate(raw_lines):
+            body = line.partition(";")[0].strip()
+            if not body:
+                cmd_type[i] = CMD_COMMENT
+                continue
+            parts = body.split()
+            code = _CMD_CODES.get(parts[0].upper())
+            if code is None:
+                continue
+            cmd_type[i] = code
+            for part in parts[1:]:
+                letter = part[0].upper()
+                try:
+                    value = float(part[1:])
+                except ValueError:
+                    continue
+                if letter == "X":
+                    xyz[i, 0] = value
+                elif letter == "Y":
+                    xyz[i, 1] = value
+                elif letter == "Z":
+                    xyz[i, 2] = value
+                elif letter == "E":
+                    e[i] = value
+                elif letter == "F":
+                    f[i] = value
+        is_extruding = (cmd_type >= 1) & (e > 0.0)
+        return cls(raw_lines, cmd_type, xyz, e, f, is_extruding)
+
+    def command(self, i):
+        """Bridge one row back to a :class:`GCodeCommand` object."""
+        return GCodeCommand.parse(self.raw_lines[i])
+
+
+def xy_distance(a, b):
+    """Euclidean distance between two (x, y) points."""
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def _layer_boundaries(move_z):
+    """Vectorized layer-start detection on a Z column.
+
+    ``move_z`` holds each line's Z word where the line is a motion command
+    and NaN elsewhere.  The running maximum tracks the current layer height;
+    a boundary is any move whose Z clears it by more than ``_LAYER_EPS``.
+    Returns the boundary indices.
+    """
+    z_run = np.fmax.accumulate(np.where(np.isnan(move_z), -np.inf, move_z))
+    prev = np.concatenate(([-np.inf], z_run[:-1]))
+    rising = ~np.isnan(move_z) & np.isfinite(prev) & (move_z > prev + _LAYER_EPS)
+    return np.flatnonzero(rising)
+
+
+def segment_gcode_into_layers(commands):
+    """Split a parsed program into layers on upward Z steps.
+
+    A new layer starts at the first move whose Z exceeds the current
+    layer's Z by more than ``_LAYER_EPS``; everything before the first
+    such move (homing, heating, priming) stays in the first layer.  One
+    comprehension extracts the Z column, then the boundary logic runs as
+    array expressions and layers come out as list slices.
+    """
+    if not commands:
+        return []
+    move_z = np.array([
+        cmd.z if (cmd.z is not None and cmd.is_move) else np.nan
+        for cmd in commands
+    ])
+    edges = [0, *_layer_boundaries(move_z).tolist(), len(commands)]
+    return [commands[a:b] for a, b in zip(edges, edges[1:]) if b > a]
+
+
+def segment_table_into_layers(table):
+    """Table counterpart of :func:`segment_gcode_into_layers`.
+
+    Works straight on the columns — no per-line Python at all — and
+    yields layers as index arrays into the table.
+    """
+    n = len(table)
+    if not n:
+        return []
+    is_move = table.cmd_type >= 0  # G0..G3; comments/other are negative
+    move_z = np.where(is_move, table.xyz[:, 2], np.nan)
+    edges = [0, *_layer_boundaries(move_z).tolist(), n]
+    return [np.arange(a, b) for a, b in zip(edges, edges[1:]) if b > a]
+
+
+def group_layer_commands_into_segments(layer_commands, start_xy=(0.0, 0.0)):
+    """Group a layer into extrusion segments plus surrounding lines.
+
+    Returns ``(head, segments)``: ``head`` is every command before the
+    first extrusion (in order, motion included — the layer's Z move and
+    any feedrate-only lines must survive), and each segment dict carries
+    the extruding commands of one continuous run with the XY where the
+    run must start, where it leaves the nozzle, and the modal feedrate
+    its first printing move runs at (None when the layer set none
+    beforehand, meaning the run inherits it from upstream).  Travel
+    moves between runs are dropped — the regeneration step emits fresh
+    ones for the optimized order and re-asserts each run's feedrate, so
+    a feedrate set on a dropped travel line is not lost.  Non-motion
+    lines inside a run stay with that run.  Extruding arcs (G2/G3) are
+    run members like G1: their X/Y words give the endpoint, and their
+    I/J words are start-relative, so a run keeps meaning after
+    reordering because travel always targets its start.
+    """
+    head = []
+    segments = []
+    current_run = None
+    x, y = start_xy
+    modal_f = None
+    for cmd in layer_commands:
+        if cmd.is_extruding:
+            if cmd.f is not None:
+                modal_f = cmd.f
+            target_x = cmd.x if cmd.x is not None else x
+            target_y = cmd.y if cmd.y is not None else y
+            if current_run is None:
+                current_run = {
+                    "start": (x, y),
+                    "commands": [],
+                    "end": (x, y),
+                    "feedrate": modal_f,
+                }
+                segments.append(current_run)
+            current_run["commands"].append(cmd)
+            x, y = target_x, target_y
+            current_run["end"] = (x, y)
+        elif cmd.is_move:
+            if cmd.f is not None:
+                modal_f = cmd.f
+            x = cmd.x if cmd.x is not None else x
+            y = cmd.y if cmd.y is not None else y
+            if segments:
+                # Travel between runs: ends the current run and is
+                # regenerated later (its F, if any, is carried modally).
+                current_run = None
+            else:
+                head.append(cmd)
+        elif current_run is not None:
+            current_run["commands"].append(cmd)
+        else:
+            head.append(cmd)
+    return head, segments
+
+
+# Dense layers switch from full O(N^2) sweeps to windowed search along the
+# Z-order curve; +/-32 curve neighbours almost always contain the true
+# nearest start because the curve preserves 2D locality.
+_MORTON_MIN_SEGMENTS = 256
+_MORTON_WINDOW = 32
+
+
+def _spread_bits16(v):
+    """Interleave zeros between the low 16 bits (the standard bit spread)."""
+    v = (v | (v << np.uint32(8))) & np.uint32(0x00FF00FF)
+    v = (v | (v << np.uint32(4))) & np.uint32(0x0F0F0F0F)
+    v = (v | (v << np.uint32(2))) & np.uint32(0x33333333)
+    v = (v | (v << np.uint32(1))) & np.uint32(0x55555555)
+    return v
+
+
+def _morton_codes(points, mins, span):
+    """Morton (Z-order) codes of (N, 2) points, 16 quantized bits per axis."""
+    q = np.clip((points - mins) / span * 65535.0, 0.0, 65535.0).astype(np.uint32)
+    return _spread_bits16(q[:, 0]) | (_spread_bits16(q[:, 1]) << np.uint32(1))
+
+
+def _nn_order_morton(extrude_segments, starts, ends, cur):
+    """Nearest-neighbour ordering restricted to a Z-order curve window.
+
+    Segments are pre-sorted by the Morton code of their start; each
+    emission searches only the +/-``_MORTON_WINDOW`` curve neighbours of
+    the current position, falling back to a global sweep when the window
+    holds no unvisited segment.  ~O(N log N) against the plain pass's
+    O(N^2), with the same greedy result whenever the window hit is the
+    true nearest.
+    """
+    n = len(extrude_segments)
+    mins = starts.min(axis=0)
+    # np.ptp: the ndarray method was removed in NumPy 2.0.
+    span = np.ptp(starts, axis=0)
+    span[span == 0.0] = 1.0
+    codes = _morton_codes(starts, mins, span)
+    z_order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[z_order]
+    active = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(n):
+        cur_code = _morton_codes(cur.reshape(1, 2), mins, span)[0]
+        p = int(np.searchsorted(sorted_codes, cur_code))
+        lo = max(0, p - _MORTON_WINDOW)
+        window = z_order[lo:p + _MORTON_WINDOW]
+        candidates = window[active[window]]
+        if candidates.size:
+            delta = starts[candidates] - cur
+            d2 = np.einsum("ij,ij->i", delta, delta)
+            i = int(candidates[d2.argmin()])
+        else:
+            delta = starts - cur
+            d2 = np.einsum("ij,ij->i", delta, delta)
+            d2[~active] = np.inf
+            i = int(d2.argmin())
+        order.append(extrude_segments[i])
+        cur = ends[i]
+        active[i] = False
+    return order
+
+
+def optimize_extrude_segments_order_nn(extrude_segments, current_xy=(0.0, 0.0)):
+    """Reorder extrusion segments greedily by nearest start point.
+
+    All start/end points are packed into (N, 2) arrays once; each step is
+    then one vectorized squared-distance sweep and an argmin, with chosen
+    rows masked to inf.  Squared distances suffice since argmin is
+    monotonic under sqrt.  Layers with at least ``_MORTON_MIN_SEGMENTS``
+    segments use the windowed Z-order variant instead of full sweeps.
+    """
+    n = len(extrude_segments)
+    if n < 2:
+        return list(extrude_segments)
+    starts = np.array([seg["start"] for seg in extrude_segments])
+    ends = np.array([seg["end"] for seg in extrude_segments])
+    cur = np.asarray(current_xy, dtype=np.float64)
+    if n >= _MORTON_MIN_SEGMENTS:
+        return _nn_order_morton(extrude_segments, starts, ends, cur)
+    if _HAVE_NUMBA:
+        # The compiled double loop beats the masked-argmin sweeps; without
+        # numba it would run interpreted, so keep the NumPy path then.
+        permutation = nn_order(starts, ends, float(cur[0]), float(cur[1]))
+        return [extrude_segments[i] for i in permutation]
+    active = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(n):
+        delta = starts - cur
+        d2 = np.einsum("ij,ij->i", delta, delta)
+        d2[~active] = np.inf
+        i = int(d2.argmin())
+        order.append(extrude_segments[i])
+        cur = ends[i]
+        active[i] = False
+    return order
+
+
+def regenerate_gcode_for_layer(head, segments, layer_z, current_xyz,
+                               travel_feedrate=DEFAULT_TRAVEL_FEEDRATE,
+                               current_f=None):
+    """Re-emit one layer's commands with fresh travel moves.
+
+    Returns ``(commands, end_xyz, end_f)``; ``current_xyz`` may be None
+    when the nozzle position is unknown, which forces an initial travel.
+    ``current_f`` threads the modal feedrate through the layers: each
+    run whose feedrate the travel move clobbered gets a feedrate-only
+    ``G1`` re-asserting it, so extrusion never runs at travel speed.
+    """
+    out = list(head)
+    # Head motion (layer Z move, priming) shifts the real position and
+    # modal feedrate before the first travel is judged.
+    x, y, z = current_xyz if current_xyz is not None else (None, None, None)
+    for cmd in head:
+        if cmd.is_move:
+            if cmd.f is not None:
+                current_f = cmd.f
+            x = cmd.x if cmd.x is not None else x
+            y = cmd.y if cmd.y is not None else y
+            z = cmd.z if cmd.z is not None else z
+    for segment in segments:
+        run_f = segment.get("feedrate")
+        if run_f is None:
+            # The layer set no F before this run: it inherits the modal
+            # feedrate in effect right now, before any travel clobbers it.
+            run_f = current_f
+        target_x, target_y = segment["start"]
+        # One branch on the summed squared offset instead of three
+        # per-axis tolerance checks.
+        needs_travel = x is None or y is None or z is None or (
+            (x - target_x) ** 2
+            + (y - target_y) ** 2
+            + (z - layer_z) ** 2
+        ) > _POS_EPS2
+        if needs_travel:
+            # Build the command object directly: every word is already in
+            # hand, so round-tripping the rendered line through parse
+            # would only re-tokenize our own output.
+            raw = "G0 F%d X%.3f Y%.3f Z%.3f" % (
+                travel_feedrate, target_x, target_y, layer_z
+            )
+            out.append(GCodeCommand(
+                raw,
+                command_type="G0",
+                x=target_x,
+                y=target_y,
+                z=layer_z,
+                f=float(travel_feedrate),
+            ))
+            current_f = float(travel_feedrate)
+        commands = segment["commands"]
+        if (run_f is not None and run_f != current_f
+                and commands and commands[0].f is None):
+            raw = "G1 F%g" % run_f
+            out.append(GCodeCommand(raw, command_type="G1", f=run_f))
+            current_f = run_f
+        out.extend(commands)
+        for cmd in commands:
+            if cmd.f is not None:
+                current_f = cmd.f
+        end_x, end_y = segment["end"]
+        x, y, z = end_x, end_y, layer_z
+    end_xyz = None if x is None or y is None or z is None else (x, y, z)
+    return out, end_xyz, current_f
+
+
+def eliminate_redundant_travel_moves_in_list(commands):
+    """Drop G0 rapids whose target is the position already reached."""
+    out = []
+    x = y = z = None
+    for cmd in commands:
+        if cmd.command_type == "G0" and cmd.f is None:
+            target = (
+                cmd.x if cmd.x is not None else x,
+                cmd.y if cmd.y is not None else y,
+                cmd.z if cmd.z is not None else z,
+            )
+            if target == (x, y, z):
+                continue
+            x, y, z = target
+        elif cmd.is_move:
+            x = cmd.x if cmd.x is not None else x
+            y = cmd.y if cmd.y is not None else y
+            z = cmd.z if cmd.z is not None else z
+        out.append(cmd)
+    return out
+
+
+# From this many layers up, planning fans out to a thread pool; the NN
+# kernel drops the GIL (nogil=True) so layers genuinely overlap.
+_PARALLEL_MIN_LAYERS = 8
+# 2-opt deltas cost O(run length) with a directed travel matrix; above
+# this many segments the quadratic sweep stops paying for itself.
+_TWO_OPT_MAX_SEGMENTS = 512
+
+
+@dataclass
+class LayerPlan:
+    """One layer's optimization result plus its cached travel matrix."""
+
+    layer_z: float | None
+    head: list
+    segments: list
+    d2: np.ndarray | None = field(default=None, repr=False)
+
+
+def _pairwise_d2(ends, starts):
+    """Squared end-to-start travel matrix via the (a-b)^2 expansion.
+
+    ``d2[i, j]`` is the squared travel of running segment j right after
+    segment i; one matmul replaces N^2 scalar distance evaluations.
+    """
+    e2 = (ends * ends).sum(1)
+    s2 = (starts * starts).sum(1)
+    d2 = e2[:, None] + s2[None, :] - 2.0 * (ends @ starts.T)
+    np.maximum(d2, 0.0, out=d2)
+    return d2
+
+
+def two_opt_improve(order, d2, iters=None):
+    """Improve a greedy order with first-improvement 2-opt reversals.
+
+    Reversing ``order[i:j+1]`` flips the visiting order of those runs —
+    never a run's internal direction.  With the directed ``d2`` matrix
+    the boundary edges are O(1) lookups, and the reversed run's internal
+    travel is accumulated incrementally as ``j`` extends — each candidate
+    adds one forward and one backward edge — so a sweep costs O(n^2)
+    total.  Runs until no swap improves or ``iters`` sweeps, whichever
+    first; typically trims 5-15% travel over pure nearest-neighbour.
+    """
+    n = len(order)
+    if iters is None:
+        iters = n
+    sweeps = 0
+    improved = True
+    while improved and sweeps < iters:
+        improved = False
+        sweeps += 1
+        for i in range(1, n - 1):
+            inner_old = 0.0
+            inner_new = 0.0
+            for j in range(i + 1, n):
+                inner_old += d2[order[j - 1], order[j]]
+                inner_new += d2[order[j], order[j - 1]]
+                old = d2[order[i - 1], order[i]] + inner_old
+                new = d2[order[i - 1], order[j]] + inner_new
+                if j + 1 < n:
+                    old += d2[order[j], order[j + 1]]
+                    new += d2[order[i], order[j + 1]]
+                if new + 1e-12 < old:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+                    # The run sums describe the pre-reversal order; move
+                    # on to the next i rather than rebuilding them.
+                    break
+    return order
+
+
+def _plan_layer(layer):
+    """Layer-local half of the optimization: group and order one layer.
+
+    Seeds the nearest-neighbour pass at the first run's own start, which
+    makes the plan independent of every other layer — the price is that
+    the seed ignores where the previous layer ends, which only perturbs
+    the greedy order, not correctness.  Mid-size layers get a 2-opt
+    polish over the cached pairwise travel matrix.
+    """
+    layer_z = next(
+        (c.z for c in layer if c.is_move and c.z is not None), None
+    )
+    if layer_z is None:
+        return LayerPlan(None, layer, [])
+    head, segments = group_layer_commands_into_segments(layer)
+    seed = segments[0]["start"] if segments else (0.0, 0.0)
+    ordered = optimize_extrude_segments_order_nn(segments, seed)
+    d2 = None
+    if 3 <= len(ordered) <= _TWO_OPT_MAX_SEGMENTS:
+        starts = np.array([seg["start"] for seg in ordered])
+        ends = np.array([seg["end"] for seg in ordered])
+        d2 = _pairwise_d2(ends, starts)
+        indices = two_opt_improve(list(range(len(ordered))), d2)
+        ordered = [ordered[i] for i in indices]
+    return LayerPlan(layer_z, head, ordered, d2)
+
+
+def _ffill(values):
+    """Forward-fill NaNs (the accumulated-index trick, no Python loop)."""
+    idx = np.where(np.isnan(values), 0, np.arange(values.size))
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+def eliminate_redundant_travel_moves(table):
+    """Vectorized counterpart of the list-based redundancy pass.
+
+    Returns a keep-mask over the table's rows.  Each axis column (masked
+    to motion rows) is forward-filled to the effective position after
+    every line; a G0 without a feedrate word is redundant exactly when
+    its effective position matches the previous row's, with NaN==NaN
+    meaning "axis never set on either side" — the same tuple-compare
+    semantics as :func:`eliminate_redundant_travel_moves_in_list`, at
+    amortized nanoseconds per line instead of a Python dispatch each.
+    """
+    n = len(table)
+    keep = np.ones(n, dtype=bool)
+    if not n:
+        return keep
+    cmd = table.cmd_type
+    is_move = cmd >= 0
+    eff = np.empty((n, 3))
+    for axis in range(3):
+        eff[:, axis] = _ffill(np.where(is_move, table.xyz[:, axis], np.nan))
+    prev = np.vstack((np.full((1, 3), np.nan), eff[:-1]))
+    same = np.all((eff == prev) | (np.isnan(eff) & np.isnan(prev)), axis=1)
+    keep &= ~((cmd == 0) & np.isnan(table.f) & same)
+    return keep
+
+
+def optimize_gcode_travel(gcode_lines, travel_feedrate=DEFAULT_TRAVEL_FEEDRATE):
+    """Reorder extrusion work per layer to minimize travel; returns lines.
+
+    Two passes: layer plans (group + nearest-neighbour order) are
+    computed independently — in parallel on big prints — then a serial
+    stitch threads the real nozzle position through the layers and emits
+    each layer's travel moves against it.
+    """
+    commands = parse_gcode_lines(gcode_lines)
+    layers = segment_gcode_into_layers(commands)
+
+    if len(layers) >= _PARALLEL_MIN_LAYERS:
+        with ThreadPoolExecutor() as executor:
+            plans = list(executor.map(_plan_layer, layers))
+    else:
+        plans = [_plan_layer(layer) for layer in layers]
+
+    out = []
+    current_xyz = None
+    current_f = None
+    for plan in plans:
+        if plan.layer_z is None:
+            # No motion with Z in this layer (pure preamble): pass
+            # through, but its F words still set the modal feedrate.
+            out.extend(plan.head)
+            for cmd in plan.head:
+                if cmd.is_move and cmd.f is not None:
+                    current_f = cmd.f
+            continue
+        regenerated, current_xyz, current_f = regenerate_gcode_for_layer(
+            plan.head, plan.segments, plan.layer_z, current_xyz,
+            travel_feedrate, current_f
+        )
+        out.extend(regenerated)
+
+    out = eliminate_redundant_travel_moves_in_list(out)
+    return [cmd.raw_line for cmd in out]
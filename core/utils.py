@@ -0,0 +1,55 @@
+"""Shared helpers for the core engine."""
+
+import logging
+
+try:
+    # orjson decodes large payloads several times faster than the stdlib;
+    # it is an optional extra, so fall back transparently.
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    # msgspec validates structure in C; another optional speed extra.
+    import msgspec
+
+    class _PathSchema(msgspec.Struct):
+        """Structural shape of a path description.
+
+        Only the collections the generator passes iterate are pinned down;
+        per-segment keys stay free-form since segment specs vary by type.
+        """
+
+        segments: list = []
+        modifiers: list = []
+        constraints: list = []
+
+    _HAVE_MSGSPEC = True
+except ImportError:
+    _HAVE_MSGSPEC = False
+
+logger = logging.getLogger(__name__)
+
+
+def parse_json_input(json_input):
+    """Parse a JSON path description into a dict.
+
+    Accepts a str/bytes payload or an already-decoded dict, which is passed
+    through unchanged.  Uses orjson when installed; with msgspec installed
+    the decoded payload is additionally schema-checked once here, so shape
+    errors surface at ingest instead of as mid-generation surprises.
+    """
+    if isinstance(json_input, dict):
+        return json_input
+    try:
+        data = _json_loads(json_input)
+    except (TypeError, ValueError) as exc:
+        logger.error("Failed to parse JSON path description: %s", exc)
+        raise
+    if _HAVE_MSGSPEC:
+        try:
+            msgspec.convert(data, _PathSchema)
+        except msgspec.ValidationError as exc:
+            logger.error("Path description failed validation: %s", exc)
+            raise ValueError(str(exc)) from exc
+    return data
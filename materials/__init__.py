@@ -0,0 +1 @@
+"""Material properties database and behavior profiles."""
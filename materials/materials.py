@@ -0,0 +1,48 @@
+"""Material properties database.
+
+Keeps per-material behavior data used by the optimizer: relative viscosity,
+workable temperature range and retraction defaults.  Values are engine-level
+defaults, not slicer profiles.
+"""
+
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+_MATERIALS = {
+    "PLA": {
+        "viscosity_index": 1.0,
+        "temperature_range": (190, 220),
+        "retraction_distance": 1.0,
+    },
+    "PETG": {
+        "viscosity_index": 1.2,
+        "temperature_range": (220, 250),
+        "retraction_distance": 1.5,
+    },
+    "ABS": {
+        "viscosity_index": 1.1,
+        "temperature_range": (230, 260),
+        "retraction_distance": 1.2,
+    },
+    "TPU": {
+        "viscosity_index": 0.8,
+        "temperature_range": (210, 240),
+        "retraction_distance": 0.5,
+    },
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_material_properties(material_name):
+    """Look up the property dict for a material, defaulting to PLA.
+
+    Cached per material name so multi-file batch runs hit the database at
+    most once per material (including the fallback warning).
+    """
+    properties = _MATERIALS.get(material_name)
+    if properties is None:
+        logger.warning("Unknown material %r, falling back to PLA", material_name)
+        properties = _MATERIALS["PLA"]
+    return properties
@@ -0,0 +1,41 @@
+"""Installation script.
+
+A plain install runs pure Python.  When Cython is present the core modules
+are additionally compiled in pure mode (the existing type annotations serve
+as hints), which speeds up the scalar dispatch/recursion paths without any
+interface change.  The ``speed`` extra pulls in the optional accelerators
+the runtime already knows how to use.
+"""
+
+from setuptools import find_packages, setup
+
+try:
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        [
+            "core/_gcode_parser.pyx",
+            "core/gcode_generator.py",
+            "core/segment_primitives.py",
+            "core/ai_optimizer.py",
+            "core/travel_optimizer.py",
+        ],
+        compiler_directives={
+            "language_level": "3",
+            "boundscheck": False,
+            "cdivision": True,
+        },
+    )
+except ImportError:
+    ext_modules = []
+
+setup(
+    name="totalcontrol",
+    version="0.2.0",
+    description="AI-powered G-code generation engine",
+    packages=find_packages(exclude=("tests",)),
+    python_requires=">=3.9",
+    install_requires=["numpy"],
+    extras_require={"speed": ["cython", "orjson", "numba"]},
+    ext_modules=ext_modules,
+)